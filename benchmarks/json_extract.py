@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import json, re, time
+from json_stream import extract_json_objects
+
+# Usage: python benchmarks/json_extract.py [size]
+# Times JSON extraction on inputs that are pathological for the old
+# regex-based _extract_json_array, which is kept here as the baseline.
+
+def legacy_extract_json_array(text):
+    arr = re.search(r"(\[\s*{[\s\S]+}\s*\])", text)
+    if arr:
+        return arr.group(1)
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end != -1 and end > start:
+        return text[start:end+1]
+    objects = re.findall(r'({.*?})', text, re.DOTALL)
+    if len(objects) > 1:
+        return "[" + ",".join(objects) + "]"
+    elif objects:
+        return objects[0]
+    return text
+
+def legacy(text):
+    try:
+        return json.loads(legacy_extract_json_array(text))
+    except ValueError:
+        return None
+
+CASE = {"Use Case Title": "Filter {x}", "Steps": ["open [menu]", "click \"Apply\""], "Test Data": {"ids": [1, 2]}}
+
+def inputs(n):
+    objs = ", ".join([json.dumps(CASE)] * n)
+    return {
+        "well_formed": f"Here you go:\n[{objs}]\nDone.",
+        "truncated": f"[{objs}, {{\"Use Case Title\": \"cut",
+        "unclosed_arrays": "[{" * n * 20,
+        "brace_prose": "Use {braces} and [brackets] { " * n * 5,
+    }
+
+def timed(fn, text):
+    start = time.perf_counter()
+    out = fn(text)
+    return round((time.perf_counter() - start) * 1000, 2), out
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, text in inputs(n).items():
+        legacy_ms, _ = timed(legacy, text)
+        new_ms, objs = timed(extract_json_objects, text)
+        print(json.dumps({"input": name, "chars": len(text), "legacy_ms": legacy_ms,
+                          "scanner_ms": new_ms, "objects": len(objs)}))
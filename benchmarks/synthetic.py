@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np
+from minhash import default_minhasher
+
+# Deterministic synthetic requirement-style corpus. Word frequencies follow
+# a Zipf law over a fixed vocabulary so BM25 postings have realistic skew.
+
+_SYLLABLES = ["ka", "lo", "ri", "tu", "me", "sa", "no", "vi", "de", "ga", "po", "zu", "fe", "xi", "ba", "ty"]
+_DOMAIN = ("user filter flight hotel dashboard chart price airline export login search "
+           "booking date range admin role share delete edit create sort page error").split()
+
+def vocabulary(size=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    words = list(_DOMAIN)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(_SYLLABLES, size=rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def _word_ids(rng, count, vocab_size, zipf=1.1):
+    # Rank-frequency sampling by inverse CDF, clipped to the vocabulary
+    ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+    cdf = np.cumsum(ranks ** -zipf)
+    return np.searchsorted(cdf, rng.random(count) * cdf[-1])
+
+def synthetic_chunks(n, words_per_chunk=120, chunks_per_doc=50, vocab_size=20000, seed=0, signatures=False):
+    """n chunk dicts shaped like ingest output; signatures=True adds the
+    MinHash signature ingest stores for dedupe (about 0.1 ms per chunk)."""
+    rng = np.random.default_rng(seed)
+    vocab = np.asarray(vocabulary(vocab_size, seed), dtype=object)
+    chunks, batch = [], 10000
+    for start in range(0, n, batch):
+        rows = min(batch, n - start)
+        ids = _word_ids(rng, rows * words_per_chunk, vocab_size).reshape(rows, words_per_chunk)
+        for offset, row in enumerate(vocab[ids]):
+            i = start + offset
+            # Sentences of 12 words
+            text = ". ".join(" ".join(row[j:j + 12]) for j in range(0, words_per_chunk, 12)) + "."
+            chunks.append({
+                "text": text,
+                "source": f"doc{i // chunks_per_doc:06d}.md",
+                "chunk_id": i % chunks_per_doc,
+                "char_count": len(text),
+                "word_count": words_per_chunk,
+            })
+            if signatures:
+                chunks[-1]["minhash"] = default_minhasher.signature(text).tolist()
+    return chunks
+
+def synthetic_queries(n, words=4, vocab_size=20000, seed=1):
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary(vocab_size, 0)
+    # Mid-frequency words, like real queries
+    ids = rng.integers(10, min(2000, vocab_size), size=(n, words))
+    return [" ".join(vocab[i] for i in row) for row in ids]
+
+def write_documents(folder, n_docs, words_per_doc=2000, seed=0):
+    """Writes n_docs .md and .txt files of synthetic paragraphs for ingest timing."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    chunks = synthetic_chunks(n_docs * (words_per_doc // 120), chunks_per_doc=words_per_doc // 120, seed=seed)
+    paths = []
+    for d in range(n_docs):
+        paras = [c["text"] for c in chunks if c["source"] == f"doc{d:06d}.md"]
+        suffix = ".md" if d % 2 == 0 else ".txt"
+        path = folder / f"synthetic{d:04d}{suffix}"
+        path.write_text("\n\n".join(paras), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    import json
+    # python benchmarks/synthetic.py 1000 out.json
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    data = synthetic_chunks(n)
+    if len(sys.argv) > 2:
+        Path(sys.argv[2]).write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    else:
+        print(json.dumps(data[:3], ensure_ascii=False, indent=2))
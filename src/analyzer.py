@@ -0,0 +1,28 @@
+from functools import lru_cache
+from nltk.stem import PorterStemmer
+import re
+
+_PUNCT = re.compile(r'[^\w\s]')
+
+class Analyzer:
+    """Lowercases, strips punctuation and Porter-stems text into tokens.
+
+    Stems are memoized per unique term, so ingest and query share the work.
+    """
+    def __init__(self, stem_cache_size=200_000):
+        self._stem = lru_cache(maxsize=stem_cache_size)(PorterStemmer().stem)
+
+    def tokens(self, text: str):
+        stem = self._stem
+        return [stem(w) for w in _PUNCT.sub('', str(text)).lower().split()]
+
+    def cache_info(self):
+        return self._stem.cache_info()
+
+    def clear_cache(self):
+        self._stem.cache_clear()
+
+default_analyzer = Analyzer()
+
+def analyze(text: str):
+    return default_analyzer.tokens(text)
@@ -0,0 +1,116 @@
+import asyncio, itertools, json, os, sys, time
+from collections import Counter
+from pathlib import Path
+
+from retrieval import load_index, retrieve_many
+from dense import load_dense_index
+from generate import agenerate
+from rate_limit import RateLimiter
+from tracing import write_prometheus_snapshot
+from profiling import configure as configure_profiling
+
+LLM_RPM = float(os.getenv("LLM_RPM", "30"))
+LLM_TPM = float(os.getenv("LLM_TPM", "12000"))
+
+def read_queries(path):
+    return [q.strip() for q in Path(path).read_text(encoding="utf-8").splitlines() if q.strip()]
+
+def iter_records(lines):
+    # JSONL input: {"query": ..., "id": ...} objects (id defaults to the
+    # record's position); bare text lines are taken as queries.
+    n = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line) if line.startswith("{") else {"query": line}
+        if not isinstance(record.get("query"), str) or not record["query"].strip():
+            raise ValueError(f"Record {n} has no query: {line[:80]}")
+        record.setdefault("id", n)
+        n += 1
+        yield record
+
+async def run_batch(queries, chunks, index=None, top_k=5, concurrency=4, limiter=None, cache=None, out=None,
+                    mode="bm25", dense_index=None):
+    # Retrieval runs as one batched pass; generation runs with at most
+    # `concurrency` requests in flight. Records are written to `out` as JSON
+    # lines in completion order, tagged with the query's position.
+    records = [{"id": i, "query": q} for i, q in enumerate(queries)]
+    return await stream_batch(iter(records), chunks, index=index, top_k=top_k, concurrency=concurrency,
+                              window=max(1, len(records)), limiter=limiter, cache=cache, out=out,
+                              mode=mode, dense_index=dense_index)
+
+async def stream_batch(records, chunks, index=None, top_k=5, concurrency=4, window=64,
+                       limiter=None, cache=None, out=None, mode="bm25", dense_index=None):
+    # Like run_batch for an iterator of {"id", "query"} records of any length:
+    # queries are read and retrieved `window` at a time, and reading stops
+    # while more than one window of queries waits for generation.
+    # mode and dense_index are passed to retrieve_many.
+    out = out or sys.stdout
+    sem = asyncio.Semaphore(concurrency)
+    statuses, pending, total = Counter(), set(), 0
+
+    async def run_one(record, chunks_for_query):
+        async with sem:
+            start = time.perf_counter()
+            result = await agenerate(record["query"], chunks_for_query, cache=cache, limiter=limiter)
+        statuses[result.get("status")] += 1
+        out.write(json.dumps({
+            **record,
+            "retrieved": len(chunks_for_query),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "result": result,
+        }, ensure_ascii=False) + "\n")
+        out.flush()
+
+    async def drain(limit):
+        nonlocal pending
+        while len(pending) > limit:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+
+    while True:
+        # Reading may block on a pipe; it runs on a thread so generation continues
+        batch = await asyncio.to_thread(lambda: list(itertools.islice(records, window)))
+        if not batch:
+            break
+        total += len(batch)
+        evidence = retrieve_many([r["query"] for r in batch], chunks, top_k=top_k, index=index,
+                                 mode=mode, dense_index=dense_index)
+        pending |= {asyncio.create_task(run_one(r, ev)) for r, ev in zip(batch, evidence)}
+        await drain(window)
+    await drain(0)
+    return {"queries": total, "statuses": dict(statuses)}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate test cases for every query in a file, as JSONL.")
+    parser.add_argument("queries", help="text file with one query per line")
+    parser.add_argument("--index", default="data/index.bin")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", choices=("bm25", "dense", "hybrid"), default="bm25")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=LLM_RPM, help="LLM requests per minute")
+    parser.add_argument("--tpm", type=float, default=LLM_TPM, help="LLM tokens per minute")
+    parser.add_argument("--out", help="output .jsonl (default: stdout)")
+    parser.add_argument("--profile-rate", type=float, help="fraction of queries to profile (default: PROFILE_RATE)")
+    args = parser.parse_args()
+    configure_profiling(rate=args.profile_rate)
+
+    chunks, index = load_index(args.index)
+    dense = load_dense_index(args.index, chunks) if args.mode != "bm25" else None
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm)
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        summary = asyncio.run(run_batch(
+            read_queries(args.queries), chunks, index=index, top_k=args.top_k,
+            concurrency=args.concurrency, limiter=limiter, out=out, mode=args.mode, dense_index=dense,
+        ))
+    finally:
+        if args.out:
+            out.close()
+        write_prometheus_snapshot()
+    print(f"[Batch] {summary['queries']} queries: {summary['statuses']} "
+          f"(rate-limit wait {limiter.waited:.1f}s)", file=sys.stderr)
@@ -0,0 +1,158 @@
+import json, mmap, struct
+from pathlib import Path
+import numpy as np
+
+# Layout (little-endian), every section 8-byte aligned:
+#   header    MAGIC, version u32, n_chunks u32, n_sources u32, minhash width m u32 (0 = none)
+#   offsets   text u64[n+1], extra u64[n+1], source name u64[s+1]
+#   columns   source idx u32[n], chunk_id u32[n], char_count u32[n], word_count u32[n]
+#   minhash   u32[n, m], only when m > 0
+#   blobs     source names, chunk texts, extra fields (one JSON object per chunk)
+MAGIC = b"RAGCHNK\0"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIII")
+_FIXED = ("text", "source", "chunk_id", "char_count", "word_count")
+
+def _align(n):
+    return (n + 7) & ~7
+
+class ChunkStore:
+    """Read-only, memory-mapped columnar chunk store.
+
+    Opening only maps the file; a chunk's text is decoded when it is read.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, s, m = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} chunk store")
+        pos = _HEADER.size
+
+        def column(dtype, count):
+            nonlocal pos
+            arr = np.frombuffer(self._mm, dtype=dtype, count=count, offset=pos)
+            pos = _align(pos + arr.nbytes)
+            return arr
+
+        self._text_off = column("<u8", n + 1)
+        self._extra_off = column("<u8", n + 1)
+        source_off = column("<u8", s + 1)
+        self.source_idx = column("<u4", n)
+        self.chunk_ids = column("<u4", n)
+        self.char_counts = column("<u4", n)
+        self.word_counts = column("<u4", n)
+        self.minhash = column("<u4", n * m).reshape(n, m) if m else None
+        self._blob = pos
+        names = bytes(self._mm[pos:pos + int(source_off[-1])])
+        self.sources = [names[source_off[i]:source_off[i + 1]].decode("utf-8") for i in range(s)]
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def _slice(self, offsets, i):
+        start = self._blob + int(offsets[i])
+        return self._mm[start:self._blob + int(offsets[i + 1])]
+
+    def text(self, i):
+        return self._slice(self._text_off, i).decode("utf-8")
+
+    def keys(self):
+        return [(self.sources[s], int(c)) for s, c in zip(self.source_idx, self.chunk_ids)]
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i %= len(self)
+        chunk = {
+            "text": self.text(i),
+            "source": self.sources[self.source_idx[i]],
+            "chunk_id": int(self.chunk_ids[i]),
+            "char_count": int(self.char_counts[i]),
+            "word_count": int(self.word_counts[i]),
+        }
+        if self.minhash is not None:
+            chunk["minhash"] = self.minhash[i].tolist()
+        extra = self._slice(self._extra_off, i)
+        if extra:
+            chunk.update(json.loads(extra))
+        return chunk
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def to_list(self):
+        return list(self)
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_list(), f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        # The column arrays borrow the mapping and must go first
+        self._text_off = self._extra_off = None
+        self.source_idx = self.chunk_ids = self.char_counts = self.word_counts = self.minhash = None
+        self._mm.close()
+
+    @staticmethod
+    def write(path, chunks):
+        chunks = chunks if isinstance(chunks, (list, ChunkStore)) else list(chunks)
+        # MinHash signatures get their own column when every chunk has one of the same width
+        widths = {len(c["minhash"]) if "minhash" in c else 0 for c in chunks}
+        m = widths.pop() if len(widths) == 1 else 0
+        fixed = _FIXED + ("minhash",) if m else _FIXED
+        source_ids, texts, extras, signatures = {}, [], [], []
+        cols = [[], [], [], []]
+        for c in chunks:
+            text = c.get("text", "")
+            texts.append(text.encode("utf-8"))
+            if m:
+                signatures.append(c["minhash"])
+            extra = {k: v for k, v in c.items() if k not in fixed}
+            extras.append(json.dumps(extra, ensure_ascii=False).encode("utf-8") if extra else b"")
+            for col, v in zip(cols, (
+                    source_ids.setdefault(c.get("source"), len(source_ids)), c.get("chunk_id", 0),
+                    c.get("char_count", len(text)), c.get("word_count", len(text.split())))):
+                col.append(v)
+        names = [str(s).encode("utf-8") for s in source_ids]
+
+        def offsets(parts, base=0):
+            out = np.full(len(parts) + 1, base, dtype="<u8")
+            out[1:] += np.cumsum([len(p) for p in parts], dtype=np.uint64)
+            return out
+
+        names_blob, text_blob, extra_blob = b"".join(names), b"".join(texts), b"".join(extras)
+        sections = [
+            offsets(texts, len(names_blob)),
+            offsets(extras, len(names_blob) + len(text_blob)),
+            offsets(names),
+            *(np.asarray(col, dtype="<u4") for col in cols),
+        ]
+        if m:
+            sections.append(np.asarray(signatures, dtype="<u4"))
+        tmp = Path(f"{path}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(texts), len(names), m))
+            for arr in sections:
+                data = arr.tobytes()
+                f.write(data + b"\0" * (_align(len(data)) - len(data)))
+            f.write(names_blob + text_blob + extra_blob)
+        tmp.replace(path)
+
+def load_chunks(path):
+    # Legacy .json chunk lists still load, fully parsed
+    path = Path(path)
+    if path.suffix == ".json":
+        return json.loads(path.read_text(encoding="utf-8"))
+    return ChunkStore(path)
+
+
+if __name__ == "__main__":
+    import sys
+    # JSON export for debugging: python chunk_store.py data/index.bin [out.json]
+    store = ChunkStore(sys.argv[1])
+    if len(sys.argv) > 2:
+        store.export_json(sys.argv[2])
+    else:
+        json.dump(store.to_list(), sys.stdout, ensure_ascii=False, indent=2)
@@ -1,17 +1,152 @@
 ﻿import re
 
-def chunk_text_smart(text, max_words=180, min_words=32):
-    paras = [p for p in re.split(r'[\n\.]{2,}|[\r\n]{2,}', text) if p.strip()]
-    chunks = []
-    for para in paras:
-        words = para.split()
-        if len(words) < min_words:
-            continue
-        elif len(words) > max_words:
-            for i in range(0, len(words), max_words):
-                cw = words[i:i+max_words]
-                if len(cw) >= min_words:
-                    chunks.append(" ".join(cw))
-        else:
-            chunks.append(para)
-    return chunks
\ No newline at end of file
+# Cut points: line breaks and whitespace after sentence-ending punctuation.
+# A match with two or more newlines (a blank line) also ends a paragraph.
+_BOUNDARY = re.compile(r'[^\S\n]*\n\s*|(?<=[.!?])\s+')
+_WORD = re.compile(r'\S+')
+
+def _units(text, base, start, end, max_words):
+    # (start, end, words) for runs of at most max_words words in text[start:end]
+    first, last, n = None, None, 0
+    for m in _WORD.finditer(text, start, end):
+        if n == max_words:
+            yield base + first, base + last, n
+            first, n = None, 0
+        if first is None:
+            first = m.start()
+        last, n = m.end(), n + 1
+    if n:
+        yield base + first, base + last, n
+
+class _Packer:
+    """Packs sentence units into chunks of at most max_words words.
+
+    A full chunk is cut at its last paragraph break when that leaves at
+    least min_words words, otherwise after its last sentence. The last
+    finished chunk is held back so a short tail can join it.
+    """
+    def __init__(self, max_words, min_words, overlap):
+        self.max_words, self.min_words, self.overlap = max_words, min_words, overlap
+        self.cur, self.words, self.carried = [], 0, 0   # units (start, end, words, para)
+        self.pending = None
+
+    def start(self):
+        # Earliest offset still needed to cut chunk text
+        if self.pending:
+            return self.pending[0]
+        return self.cur[0][0] if self.cur else None
+
+    def _paragraph_cut(self):
+        cut, words = None, 0
+        for i, unit in enumerate(self.cur):
+            if i and unit[3] and words >= self.min_words:
+                cut = i
+            words += unit[2]
+        return cut
+
+    def _close(self, cut=None):
+        head = self.cur[:cut] if cut else self.cur
+        words = sum(unit[2] for unit in head)
+        done, self.pending = self.pending, (head[0][0], head[-1][1], words)
+        if cut:
+            self.cur, self.words, self.carried = self.cur[cut:], self.words - words, 0
+            return [done] if done else []
+        keep, kept = [], 0
+        # Overlap repeats whole trailing sentences, never the whole chunk
+        for unit in reversed(self.cur[1:]):
+            if kept + unit[2] > self.overlap:
+                break
+            keep.insert(0, unit)
+            kept += unit[2]
+        self.cur, self.words, self.carried = keep, kept, kept
+        return [done] if done else []
+
+    def add(self, start, end, words, para):
+        out = []
+        while (self.words > self.carried and self.words + words > self.max_words
+               and self.words >= self.min_words):
+            out += self._close(self._paragraph_cut())
+        if para and self.words == self.carried:
+            # Overlap does not cross paragraphs
+            self.cur, self.words, self.carried = [], 0, 0
+        while self.cur and self.words == self.carried and self.words + words > self.max_words:
+            self.words -= self.cur.pop(0)[2]
+            self.carried = self.words
+        self.cur.append((start, end, words, para))
+        self.words += words
+        return out
+
+    def finish(self):
+        new_words = self.words - self.carried
+        out = []
+        if new_words:
+            if (new_words < self.min_words and self.pending
+                    and self.pending[2] + new_words <= self.max_words + self.min_words):
+                start, _, words = self.pending
+                self.pending = (start, self.cur[-1][1], words + new_words)
+            else:
+                out = self._close()
+        if self.pending:
+            out.append(self.pending)
+        return out
+
+def iter_chunks(pieces, max_words=180, min_words=32, overlap=0, joiner="\n"):
+    """Yields {"text", "start", "end"} chunks of joiner.join(pieces).
+
+    Chunks end at sentence or line boundaries, preferably paragraph breaks,
+    and short paragraphs are merged with their neighbours rather than
+    dropped. `overlap` repeats up to that many words of trailing sentences
+    at the start of the next chunk when a paragraph is split. start/end are character
+    offsets into the joined text. Only the open chunk is buffered, and each
+    character is scanned a bounded number of times.
+    """
+    if not 0 <= overlap < max_words:
+        raise ValueError("overlap must be in [0, max_words)")
+    packer = _Packer(max_words, min_words, overlap)
+    buf, base = "", 0   # buf holds the text from offset base on
+    pos, para = 0, False  # where the open unit starts; a paragraph break precedes it
+
+    def emit(done):
+        for start, end, _ in done:
+            yield {"text": buf[start - base:end - base], "start": start, "end": end}
+
+    def add(start, end):
+        nonlocal para
+        for unit in _units(buf, base, start - base, end - base, max_words):
+            yield from emit(packer.add(*unit, para))
+            para = False
+
+    # Scan state, so each piece only scans the new text: word starts from
+    # pos on, where the word scan stopped, and the end of the last word
+    # (boundaries are whitespace, so none can start before it)
+    starts, scanned, word_end = [], 0, 0
+    first = True
+    for piece in pieces:
+        buf = piece if first else buf + joiner + piece
+        first = False
+        for m in _BOUNDARY.finditer(buf, max(pos, word_end) - base):
+            if m.end() == len(buf):
+                break  # may still grow with the next piece
+            yield from add(pos, base + m.start())
+            para = para or m.group().count("\n") >= 2
+            pos = base + m.end()
+            starts, scanned = [], max(scanned, pos)
+        # A run without boundaries is cut into whole windows, keeping the
+        # last word since it may continue in the next piece
+        for m in _WORD.finditer(buf, scanned - base):
+            word_end = base + m.end()
+            if m.start() == scanned - base and scanned > pos and not buf[m.start() - 1].isspace():
+                continue  # the last word scanned, grown by this piece
+            starts.append(base + m.start())
+            if len(starts) > max_words:
+                yield from add(pos, starts[max_words])
+                pos, starts = starts[max_words], starts[max_words:]
+        scanned = base + len(buf)
+        keep = packer.start()
+        keep = pos if keep is None else min(keep, pos)
+        buf, base = buf[keep - base:], keep
+    yield from add(pos, base + len(buf))
+    yield from emit(packer.finish())
+
+def chunk_text_smart(text, max_words=180, min_words=32, overlap=0):
+    return [c["text"] for c in iter_chunks([text], max_words, min_words, overlap)]
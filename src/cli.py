@@ -0,0 +1,160 @@
+import sys
+from pathlib import Path
+# `python -m src.cli` (the Docker entry point) runs this as src.cli; the
+# modules import each other by bare name, so their folder goes on the path.
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import argparse, asyncio, json, os
+
+from ingest import INGEST_WORKERS, update_index
+from retrieval import load_index, retrieve_many
+from dense import load_dense_index
+from generate import generate
+from batch import LLM_RPM, LLM_TPM, iter_records, stream_batch
+from rate_limit import RateLimiter
+from profiling import configure as configure_profiling, profiled
+from tracing import write_prometheus_snapshot
+
+# Usage:
+#   python -m src.cli ingest data/sample [more files or folders] [--prune] [--rebuild]
+#   python -m src.cli query "twin bed filters" [--top-k 5] [--json]
+#   python -m src.cli generate "Create use cases for hotel filters"
+#   python -m src.cli batch queries.jsonl --out results.jsonl   (or stdin/stdout)
+
+INDEX_PATH = os.getenv("INDEX_PATH", "data/index.bin")
+
+def collect_files(paths):
+    # Folders contribute the files directly inside them
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files += sorted(f for f in p.glob("*") if f.is_file())
+        elif p.is_file():
+            files.append(p)
+        else:
+            raise SystemExit(f"No such file or folder: {p}")
+    return files
+
+def load(args):
+    # Everything a query needs, loaded once per process
+    if not Path(args.index).exists():
+        raise SystemExit(f"No index at {args.index}; run `python -m src.cli ingest <folder>` first.")
+    chunks, index = load_index(args.index)
+    dense = load_dense_index(args.index, chunks) if args.mode != "bm25" else None
+    return chunks, index, dense
+
+def cmd_ingest(args):
+    with profiled("ingest") as profile:
+        summary = update_index(collect_files(args.paths), args.index, workers=args.workers,
+                               rebuild=args.rebuild, prune=args.prune)
+    print(f"[Ingest] {summary['changed']} new or changed, {summary['removed']} removed, "
+          f"{summary['chunks']} chunks in {args.index}")
+    if summary["empty"]:
+        print(f"[Ingest] No text extracted from: {', '.join(summary['empty'])}", file=sys.stderr)
+    if summary["sanitized"]:
+        print(f"[Ingest] Removed injection-like lines from: {', '.join(summary['sanitized'])}")
+    if profile:
+        print(f"[Ingest] Profile written to {profile['pstats']} and {profile['alloc']}", file=sys.stderr)
+    return 0
+
+def cmd_query(args):
+    chunks, index, dense = load(args)
+    queries = args.queries or [q.strip() for q in sys.stdin if q.strip()]
+    with profiled("query"):
+        results = retrieve_many(queries, chunks, top_k=args.top_k, index=index, mode=args.mode, dense_index=dense)
+    for query, hits in zip(queries, results):
+        if args.json:
+            print(json.dumps({"query": query, "results": [
+                {"rank": rank, "source": h.get("source"), "chunk_id": h.get("chunk_id"),
+                 "score": round(h["score"], 3), "text": h.get("text", "")}
+                for rank, h in enumerate(hits, 1)]}, ensure_ascii=False))
+            continue
+        print(f"Query: {query}")
+        for rank, h in enumerate(hits, 1):
+            snippet = " ".join(h.get("text", "").split())[:160]
+            print(f"{rank:3}. {h['score']:.3f}  {h.get('source')}#{h.get('chunk_id')}  {snippet}")
+        if not hits:
+            print("  (no matching chunks)")
+    return 0
+
+def cmd_generate(args):
+    chunks, index, dense = load(args)
+    with profiled("generate"):
+        evidence = retrieve_many([args.query], chunks, top_k=args.top_k, index=index,
+                                 mode=args.mode, dense_index=dense)[0]
+        result = generate(args.query, evidence, cache=False if args.no_cache else None)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result.get("status") == "error" else 0
+
+def cmd_batch(args):
+    chunks, index, dense = load(args)
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm)
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        summary = asyncio.run(stream_batch(
+            iter_records(src), chunks, index=index, top_k=args.top_k, concurrency=args.concurrency,
+            window=args.window, limiter=limiter, cache=False if args.no_cache else None, out=out,
+            mode=args.mode, dense_index=dense,
+        ))
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if args.out:
+            out.close()
+    print(f"[Batch] {summary['queries']} queries: {summary['statuses']} "
+          f"(rate-limit wait {limiter.waited:.1f}s)", file=sys.stderr)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Ingest documents, retrieve evidence and generate test cases.")
+    parser.add_argument("--index", default=INDEX_PATH, help="chunk store path (default: INDEX_PATH or data/index.bin)")
+    parser.add_argument("--profile-rate", type=float, help="fraction of runs to profile (default: PROFILE_RATE)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest", help="add new or changed files to the index")
+    p.add_argument("paths", nargs="+", help="files or folders (the files directly inside them)")
+    p.add_argument("--prune", action="store_true", help="also drop indexed files not given, so the index holds exactly these")
+    p.add_argument("--workers", type=int, default=INGEST_WORKERS, help="extraction processes (0 = one per CPU)")
+    p.add_argument("--rebuild", action="store_true", help="re-extract the given files even if unchanged")
+    p.set_defaults(func=cmd_ingest)
+
+    def retrieval_options(p):
+        p.add_argument("--top-k", type=int, default=5)
+        p.add_argument("--mode", choices=("bm25", "dense", "hybrid"), default="bm25")
+
+    p = sub.add_parser("query", help="print the ranked chunks for one or more queries")
+    p.add_argument("queries", nargs="*", help="queries (default: one per line from stdin)")
+    retrieval_options(p)
+    p.add_argument("--json", action="store_true", help="one JSON line per query")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("generate", help="generate test cases for one query")
+    p.add_argument("query")
+    retrieval_options(p)
+    p.add_argument("--no-cache", action="store_true", help="skip the LLM response cache")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("batch", help="generate for a JSONL stream of queries, writing JSONL results")
+    p.add_argument("input", nargs="?", default="-", help='JSONL of {"query", "id"} or plain lines (default: stdin)')
+    p.add_argument("--out", help="output .jsonl (default: stdout)")
+    retrieval_options(p)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--window", type=int, default=64, help="queries read and retrieved at a time")
+    p.add_argument("--rpm", type=float, default=LLM_RPM, help="LLM requests per minute")
+    p.add_argument("--tpm", type=float, default=LLM_TPM, help="LLM tokens per minute")
+    p.add_argument("--no-cache", action="store_true", help="skip the LLM response cache")
+    p.set_defaults(func=cmd_batch)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_profiling(rate=args.profile_rate)
+    try:
+        return args.func(args)
+    finally:
+        write_prometheus_snapshot()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import json, os, zlib
+from pathlib import Path
+import numpy as np
+from analyzer import default_analyzer
+from chunk_store import ChunkStore
+from tracing import tracer
+
+class Embedder:
+    """Turns texts into L2-normalized float32 vectors of size `dim`."""
+    name = "base"
+    dim = 0
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+class HashingEmbedder(Embedder):
+    """Deterministic offline stand-in: signed feature hashing of stemmed
+    unigrams and bigrams. Needs no model download, useful for tests."""
+    def __init__(self, dim=384, analyzer=None):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        self.analyzer = analyzer or default_analyzer
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = self.analyzer.tokens(text)
+            for feat in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                h = zlib.crc32(feat.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return np.divide(out, norms, out=out, where=norms > 0)
+
+class SentenceTransformerEmbedder(Embedder):
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = model_name
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        return np.asarray(self.model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+def get_embedder(name=None):
+    # EMBEDDER=hashing[-dim] for the offline stand-in, otherwise a sentence-transformers model
+    name = name or os.getenv("EMBEDDER", "sentence-transformers/all-MiniLM-L6-v2")
+    if name.startswith("hashing"):
+        dim = name.partition("-")[2]
+        return HashingEmbedder(int(dim) if dim else 384)
+    return SentenceTransformerEmbedder(name)
+
+def dense_path_for(chunks_path) -> Path:
+    # data/index.bin -> data/index.faiss (+ data/index.faiss.json)
+    p = Path(chunks_path)
+    return p.with_name(f"{p.stem}.faiss")
+
+class DenseIndex:
+    """Inner-product FAISS index over chunk embeddings.
+
+    kind="flat" is exact; kind="ivf" clusters vectors into `nlist` lists
+    and probes `nprobe` of them per query. Chunks get stable integer ids,
+    so documents can be removed without renumbering.
+    """
+    def __init__(self, embedder, kind="flat", nlist=100, nprobe=8):
+        import faiss
+        self.embedder, self.kind, self.nlist, self.nprobe = embedder, kind, nlist, nprobe
+        self.index = None
+        self.chunks = {}   # id -> chunk dict, or position in self.store until read
+        self.keys = {}     # id -> (source, chunk_id)
+        self.store = None
+        self._next_id = 0
+        self._faiss = faiss
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, chunks, embedder, batch_size=64, **params):
+        with tracer.span("index_build", kind="dense", embedder=embedder.name) as span:
+            index = cls(embedder, **params)
+            span.set(chunks=index.add(chunks, batch_size=batch_size))
+        return index
+
+    def _make_index(self, sample):
+        faiss, dim = self._faiss, self.embedder.dim
+        if self.kind == "ivf":
+            # IVF needs at least one training vector per list
+            nlist = max(1, min(self.nlist, len(sample)))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(sample)
+            index.nprobe = min(self.nprobe, nlist)
+            return index
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def add(self, chunks, batch_size=64):
+        chunks = [c for c in chunks if c.get("text", "").strip()]
+        vectors = [self.embedder.embed([c["text"] for c in chunks[i:i + batch_size]])
+                   for i in range(0, len(chunks), batch_size)]
+        if not chunks:
+            return 0
+        vectors = np.vstack(vectors)
+        if self.index is None:
+            self.index = self._make_index(vectors)
+        ids = np.arange(self._next_id, self._next_id + len(chunks), dtype=np.int64)
+        self.index.add_with_ids(vectors, ids)
+        for i, c in zip(ids.tolist(), chunks):
+            self.chunks[i] = c
+            self.keys[i] = (c.get("source"), c.get("chunk_id"))
+        self._next_id += len(chunks)
+        return len(chunks)
+
+    def remove(self, source):
+        ids = [i for i, key in self.keys.items() if key[0] == source]
+        if ids and self.index is not None:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+        for i in ids:
+            del self.chunks[i], self.keys[i]
+        return len(ids)
+
+    def chunk(self, i):
+        c = self.chunks[i]
+        if isinstance(c, int):
+            c = self.chunks[i] = self.store[c]
+        return c
+
+    def search(self, queries, k):
+        # Returns (scores, ids) arrays of shape (len(queries), k); missing hits have id -1
+        if self.index is None or not len(self):
+            return np.zeros((len(queries), 0)), np.zeros((len(queries), 0), dtype=np.int64)
+        return self.index.search(self.embedder.embed(queries), min(k, len(self)))
+
+    def save(self, path):
+        path = Path(path)
+        self._faiss.write_index(self.index, str(path))
+        meta = {
+            "embedder": self.embedder.name, "dim": self.embedder.dim,
+            "kind": self.kind, "nlist": self.nlist, "nprobe": self.nprobe, "next_id": self._next_id,
+            "docs": [[i, source, chunk_id] for i, (source, chunk_id) in self.keys.items()],
+        }
+        Path(f"{path}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, chunks, embedder):
+        meta = json.loads(Path(f"{path}.json").read_text(encoding="utf-8"))
+        if meta["embedder"] != embedder.name or meta["dim"] != embedder.dim:
+            raise ValueError(f"{path} was built with {meta['embedder']}, not {embedder.name}")
+        index = cls(embedder, kind=meta["kind"], nlist=meta["nlist"], nprobe=meta["nprobe"])
+        index.index = index._faiss.read_index(str(path))
+        index._next_id = meta["next_id"]
+        if isinstance(chunks, ChunkStore):
+            index.store = chunks
+            by_key = {key: pos for pos, key in enumerate(chunks.keys())}
+            expected = len(chunks)
+        else:
+            by_key = {(c.get("source"), c.get("chunk_id")): c for c in chunks}
+            expected = sum(1 for c in chunks if c.get("text", "").strip())
+        for i, source, chunk_id in meta["docs"]:
+            key = (source, chunk_id)
+            if key not in by_key:
+                raise ValueError(f"Dense index {path} is stale: missing chunk {source}#{chunk_id}")
+            index.chunks[i] = by_key[key]
+            index.keys[i] = key
+        # Chunks added without updating the dense index would never be returned
+        if len(index) != expected or index.index.ntotal != expected:
+            raise ValueError(f"Dense index {path} is stale: chunk count differs")
+        return index
+
+def load_dense_index(chunks_path, chunks, embedder=None, kind=None):
+    # Loads data/index.faiss, or builds and saves it when missing or stale
+    embedder = embedder or get_embedder()
+    path = dense_path_for(chunks_path)
+    try:
+        return DenseIndex.load(path, chunks, embedder)
+    except (OSError, ValueError, KeyError, RuntimeError):
+        index = DenseIndex.build(chunks, embedder, kind=kind or os.getenv("DENSE_INDEX_KIND", "flat"))
+        if index.index is not None:
+            index.save(path)
+        return index
+
+def dense_retrieve_many(queries, index, top_k=5, min_score=0.1):
+    scores, ids = index.search(list(queries), top_k)
+    return [
+        [dict(index.chunk(int(i)), score=float(s)) for s, i in zip(row_s, row_i) if i >= 0 and s > min_score]
+        for row_s, row_i in zip(scores, ids)
+    ]
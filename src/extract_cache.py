@@ -0,0 +1,74 @@
+import hashlib, json, os, tempfile
+from pathlib import Path
+from typing import Optional
+
+def file_digest(file_path) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class ExtractionCache:
+    """On-disk cache of extracted text and chunks, keyed by file content.
+
+    One JSON file per entry; the mtime doubles as last-access time so
+    evict() can drop least recently used entries once over max_bytes.
+    """
+    def __init__(self, root, max_bytes: int = 512 * 2**20, version: str = "1"):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.version = version
+
+    def key(self, file_path, digest: Optional[str] = None) -> str:
+        # digest, when the caller already has file_digest(file_path), saves rereading the file.
+        # The extractor is picked by suffix, so it is part of the key too
+        digest = digest or file_digest(file_path)
+        return hashlib.sha256(f"{digest}|{Path(file_path).suffix.lower()}|{self.version}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, entry: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so concurrent ingest workers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def evict(self) -> int:
+        entries = []
+        for p in self.root.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+def default_extraction_cache(version: str = "1") -> Optional[ExtractionCache]:
+    # EXTRACT_CACHE_DIR="" disables caching
+    root = os.getenv("EXTRACT_CACHE_DIR", "data/cache/extract")
+    if not root:
+        return None
+    max_bytes = int(os.getenv("EXTRACT_CACHE_MAX_MB", "512")) * 2**20
+    return ExtractionCache(root, max_bytes=max_bytes, version=version)
@@ -1,20 +1,132 @@
 ﻿from dotenv import load_dotenv
 load_dotenv()
-import os, json, logging, re
-from guardrails import sanitize
+import os, logging, random, threading, time, asyncio
+from guardrails import prompt_text
+from llm_cache import LLMCache, default_llm_cache
+from json_stream import JSONObjectStream, extract_json_objects
+from tracing import tracer
+from profiling import profiled
+from tokens import count_tokens, truncate_to_tokens
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 USE_GROQ = bool(GROQ_API_KEY)
 logger = logging.getLogger(__name__)
 
+MODEL = 'llama-3.3-70b-versatile'
+SYSTEM_PROMPT = (
+    "You are a QA Engineer. Answer ONLY using the evidence. "
+    "ALWAYS output ALL test/use cases as a SINGLE JSON ARRAY, with objects containing: "
+    "'Use Case Title', 'Goal', 'Preconditions', 'Test Data', 'Steps', 'Expected Results', 'Negative cases', 'Boundary cases'. "
+    "If you can't answer, output a single object with 'status', 'clarifying_questions'."
+)
+TEMPERATURE, TOP_P, MAX_TOKENS = 0.1, 0.92, 1800
+# Input tokens allowed for retrieved context in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+MIN_CHUNK_TOKENS = 16  # don't truncate a chunk into less room than this
+
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+GROQ_READ_TIMEOUT = float(os.getenv("GROQ_READ_TIMEOUT", "60"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "0.5"))
+GROQ_BACKOFF_MAX = float(os.getenv("GROQ_BACKOFF_MAX", "8"))
+
 if USE_GROQ:
+    import groq, httpx
     from groq import Groq
 else:
-    print("GROQ_API_KEY not set! Cannot generate.")
+    # stderr, so CLI output on stdout stays clean JSON
+    logger.warning("GROQ_API_KEY not set! Cannot generate.")
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    # One keep-alive client per process; rebuilt after a fork
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = Groq(
+                    api_key=GROQ_API_KEY,
+                    max_retries=0,  # retries are handled by _call_with_retries
+                    timeout=httpx.Timeout(GROQ_READ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT),
+                    http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60)),
+                )
+                _client_pid = os.getpid()
+    return _client
+
+def _is_retryable(exc):
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return USE_GROQ and isinstance(exc, groq.APIConnectionError)
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _call_with_retries(call, max_retries=None, sleep=None, before_retry=None):
+    # Full-jitter exponential backoff on 429/5xx and connection errors.
+    # before_retry() runs ahead of each retry, outside its latency (e.g. to charge a rate limiter).
+    # Returns (value, stats); on final failure the exception carries .llm_stats.
+    max_retries = GROQ_MAX_RETRIES if max_retries is None else max_retries
+    sleep = sleep or time.sleep
+    latencies = []
+    for attempt in range(max_retries + 1):
+        if attempt and before_retry is not None:
+            before_retry()
+        start = time.perf_counter()
+        try:
+            value = call()
+            latencies.append(time.perf_counter() - start)
+            return value, _llm_stats(latencies)
+        except Exception as e:
+            latencies.append(time.perf_counter() - start)
+            if attempt == max_retries or not _is_retryable(e):
+                e.llm_stats = _llm_stats(latencies)
+                raise
+            delay = random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt))
+            delay = max(delay, _retry_after(e) or 0)
+            logger.warning(f"LLM call failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s")
+            sleep(delay)
+
+def _llm_stats(latencies):
+    return {
+        "retries": len(latencies) - 1,
+        "latency_ms": round(sum(latencies) * 1000, 1),
+        "attempt_latencies_ms": [round(t * 1000, 1) for t in latencies],
+    }
 
-def generate(query: str, evidence_chunks):
+def generate(query: str, evidence_chunks, cache=None, limiter=None):
+    # cache=None uses the default on-disk response cache, cache=False disables it.
+    # limiter (a rate_limit.RateLimiter) is charged right before each LLM request;
+    # its wait is reported as result["llm"]["rate_limit_wait_ms"], not as latency.
+    # Runs sampled by PROFILE_RATE carry result["profile"] with the report paths.
+    with profiled("generate") as profile:
+        for event, payload in _generate_events(query, evidence_chunks, cache, limiter, stream=False):
+            if event == "result":
+                break
+    if profile:
+        payload["profile"] = profile
+    return payload
+
+async def agenerate(query: str, evidence_chunks, cache=None, limiter=None):
+    # Runs on a worker thread so the shared keep-alive client is reused;
+    # rate-limit waits block that thread, not the event loop.
+    return await asyncio.to_thread(generate, query, evidence_chunks, cache, limiter)
+
+def generate_stream(query: str, evidence_chunks, cache=None, limiter=None):
+    # Yields ("case", obj) as soon as each test-case object is complete, then
+    # ("result", dict) with the same shape generate() returns.
+    yield from _generate_events(query, evidence_chunks, cache, limiter, stream=True)
+
+def _generate_events(query, evidence_chunks, cache, limiter, stream):
     if not evidence_chunks:
-        return {
+        yield "result", {
             "output_json": [{
                 "status": "insufficient_evidence",
                 "message": "No relevant documentation found. Please add files.",
@@ -25,9 +137,10 @@ def generate(query: str, evidence_chunks):
             }],
             "status": "insufficient_evidence"
         }
+        return
     avg_score = sum(c.get("score", 0) for c in evidence_chunks) / len(evidence_chunks)
     if avg_score < 0.2:
-        return {
+        yield "result", {
             "output_json": [{
                 "status": "low_confidence",
                 "message": f"Evidence too weak (avg score: {avg_score:.2f}).",
@@ -38,42 +151,96 @@ def generate(query: str, evidence_chunks):
             }],
             "status": "low_confidence"
         }
-    prompt = _build_json_prompt(query, evidence_chunks)
+        return
+    spans = []   # this request's stage timings, returned as result["trace"]
+    with tracer.span("prompt_build", sink=spans, chunks=len(evidence_chunks)) as span:
+        prompt, packing = _build_json_prompt(query, evidence_chunks)
+        span.set(prompt_tokens=packing["prompt_tokens"], chunks_packed=packing["chunks_packed"])
     try:
         if not USE_GROQ:
-            return {
+            yield "result", {
                 "output_json": [{
                     "status": "error",
                     "message": "GROQ_API_KEY missing, cannot generate."
                 }],
                 "status": "error"
             }
-        client = Groq(api_key=GROQ_API_KEY)
-        response = client.chat.completions.create(
-            model='llama-3.3-70b-versatile',
-            messages=[
-                {
-                    'role': 'system',
-                    'content': (
-                        "You are a QA Engineer. Answer ONLY using the evidence. "
-                        "ALWAYS output ALL test/use cases as a SINGLE JSON ARRAY, with objects containing: "
-                        "'Use Case Title', 'Goal', 'Preconditions', 'Test Data', 'Steps', 'Expected Results', 'Negative cases', 'Boundary cases'. "
-                        "If you can't answer, output a single object with 'status', 'clarifying_questions'."
-                    )
-                },
+            return
+        if cache is None:
+            cache = default_llm_cache()
+        elif cache is False:
+            cache = None
+        key = LLMCache.make_key(
+            model=MODEL, system=SYSTEM_PROMPT, prompt=prompt,
+            temperature=TEMPERATURE, top_p=TOP_P, max_tokens=MAX_TOKENS,
+        ) if cache is not None else None
+        with tracer.span("llm_cache", sink=spans, enabled=cache is not None) as span:
+            output = cache.get(key) if cache is not None else None
+            span.outcome = "hit" if output is not None else "miss"
+        cache_hit, llm_stats = output is not None, None
+        if cache_hit:
+            if stream:
+                for obj in JSONObjectStream().feed(output):
+                    yield "case", obj
+        else:
+            client = _get_client()
+            messages = [
+                { 'role': 'system', 'content': SYSTEM_PROMPT },
                 { 'role': 'user', 'content': prompt }
-            ],
-            temperature=0.1,
-            max_tokens=1800,
-            top_p=0.92
-        )
-        output = response.choices[0].message.content.strip()
-        arr = _extract_json_array(output)
-        result = json.loads(arr)
-        return {
+            ]
+            request_tokens = packing["prompt_tokens"] + MAX_TOKENS
+            waits = []
+
+            def charge():
+                if limiter is not None:
+                    waits.append(limiter.acquire(request_tokens))
+
+            def call():
+                return client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                    top_p=TOP_P,
+                    stream=stream
+                )
+            # Only opening the request is retried; a stream that fails midway is an error.
+            # A streamed call's span also covers the caller's work between cases.
+            # The first request is charged before the span starts; retries re-charge
+            # inside it, like their backoff.
+            charge()
+            with tracer.span("llm_call", sink=spans, model=MODEL, stream=stream,
+                             request_tokens=request_tokens) as span:
+                try:
+                    response, llm_stats = _call_with_retries(call, before_retry=charge)
+                except Exception as e:
+                    if getattr(e, "llm_stats", None):
+                        e.llm_stats["rate_limit_wait_ms"] = round(sum(waits) * 1000, 1)
+                    span.set(retries=(getattr(e, "llm_stats", None) or {}).get("retries"))
+                    raise
+                llm_stats["rate_limit_wait_ms"] = round(sum(waits) * 1000, 1)
+                span.set(retries=llm_stats["retries"], rate_limit_wait_ms=llm_stats["rate_limit_wait_ms"])
+                if stream:
+                    output = yield from _consume_stream(response, llm_stats)
+                else:
+                    output = response.choices[0].message.content.strip()
+                span.set(output_chars=len(output))
+        with tracer.span("json_parse", sink=spans, chars=len(output)) as span:
+            result = extract_json_objects(output)
+            span.set(objects=len(result))
+            if not result:
+                raise ValueError("No JSON objects found in model output")
+        if cache is not None and not cache_hit:
+            # Only completions that parsed are worth replaying
+            cache.put(key, output)
+        yield "result", {
             "output_json": result,
             "status": "success",
-            "model_used": "llama-3.3-70b-versatile",
+            "model_used": MODEL,
+            "cache_hit": cache_hit,
+            "llm": llm_stats,
+            "prompt_packing": packing,
+            "trace": spans,
             "avg_evidence_score": round(avg_score, 3),
             "evidence_summary": [
                 {
@@ -86,34 +253,63 @@ def generate(query: str, evidence_chunks):
         }
     except Exception as e:
         logger.error(f"Generation failed: {e}")
-        return {
+        yield "result", {
             "output_json": [{
                 "status": "error",
                 "message": "LLM/generation error.",
                 "raw_exception": str(e)
             }],
-            "status": "error"
+            "status": "error",
+            "llm": getattr(e, "llm_stats", None),
+            "trace": spans,
         }
 
-def _build_json_prompt(query: str, chunks):
-    ctx = ""
-    for i, c in enumerate(chunks, 1):
-        ctx += f"[{i}] {sanitize(c['text'])}\n"
-    return f"CONTEXT:\n{ctx}\nQUERY: {query}\n\nOUTPUT JSON AS A SINGLE ARRAY BELOW:"
-
-def _extract_json_array(text: str):
-    # Find the first JSON array in the text
-    arr = re.search(r"(\[\s*{[\s\S]+}\s*\])", text)  
-    if arr:
-        return arr.group(1)
-    # Fallback: try any text between []
-    start, end = text.find("["), text.rfind("]")
-    if start != -1 and end != -1 and end > start:
-        return text[start:end+1]
-    # Fallback: wrap {...}{...} as array
-    objects = re.findall(r'({.*?})', text, re.DOTALL)
-    if len(objects) > 1:
-        return "[" + ",".join(objects) + "]"
-    elif objects:
-        return objects[0]
-    return text
\ No newline at end of file
+def _consume_stream(response, llm_stats):
+    parser, parts = JSONObjectStream(), []
+    start = time.perf_counter()
+    try:
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            parts.append(delta)
+            for obj in parser.feed(delta):
+                if "first_case_ms" not in llm_stats:
+                    llm_stats["first_case_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                yield "case", obj
+    finally:
+        close = getattr(response, "close", None)
+        if close:
+            close()
+    llm_stats["stream_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return "".join(parts).strip()
+
+def _build_json_prompt(query: str, chunks, budget=None):
+    # Packs chunks in score order until the context budget (approximate
+    # llama-3 tokens) is spent; a chunk that does not fit whole is cut at a
+    # sentence boundary. Returns (prompt, packing stats).
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    lines, used, truncated = [], 0, 0
+    for c in sorted(chunks, key=lambda c: -c.get("score", 0)):
+        remaining = budget - used
+        text = prompt_text(c)  # sanitized once at ingest
+        cost = count_tokens(text) + 3  # "[i] " prefix and newline
+        if cost > remaining:
+            if remaining - 3 < MIN_CHUNK_TOKENS:
+                continue
+            text = truncate_to_tokens(text, remaining - 3)
+            if not text:
+                continue
+            cost = count_tokens(text) + 3
+            truncated += 1
+        lines.append(f"[{len(lines) + 1}] {text}\n")
+        used += cost
+    prompt = f"CONTEXT:\n{''.join(lines)}\nQUERY: {query}\n\nOUTPUT JSON AS A SINGLE ARRAY BELOW:"
+    return prompt, {
+        "context": used,
+        "prompt_tokens": count_tokens(SYSTEM_PROMPT) + count_tokens(prompt),
+        "budget": budget,
+        "chunks_packed": len(lines),
+        "chunks_truncated": truncated,
+        "chunks_dropped": len(chunks) - len(lines),
+    }
@@ -1,25 +1,38 @@
-import re
+import os, re
+import numpy as np
 from statistics import mean
 from typing import List
+from minhash import band_pairs, containment, default_minhasher, lsh_params, similarity
+
+# Lines starting (after whitespace, any case) with one of these are dropped
+_INJECTION = re.compile(
+    r"\s*(?:system:|assistant:|user:|ignore|do not follow|disregard|forget previous|new instructions)",
+    re.IGNORECASE,
+)
+
+def sanitize_lines(text: str):
+    """Returns (sanitized text, number of lines removed)."""
+    if not text: return text, 0
+    lines = text.splitlines()
+    out = [line for line in lines if not _INJECTION.match(line)]
+    return "\n".join(out), len(lines) - len(out)
 
 def sanitize(text: str) -> str:
-    if not text: return text
-    dangerous_patterns = [
-        r"^system:",
-        r"^assistant:",
-        r"^user:",
-        r"^ignore",
-        r"^do not follow",
-        r"^disregard",
-        r"^forget previous",
-        r"^new instructions",
-    ]
-    out = []
-    for line in text.splitlines():
-        line_lower = line.strip().lower()
-        if not any(re.match(pat, line_lower) for pat in dangerous_patterns):
-            out.append(line)
-    return "\n".join(out)
+    return sanitize_lines(text)[0]
+
+def sanitize_chunk(chunk: dict) -> dict:
+    # Done once at ingest: flags the chunk and keeps the cleaned text only when it differs
+    text, removed = sanitize_lines(chunk.get("text", ""))
+    chunk["sanitized"] = bool(removed)
+    if removed:
+        chunk["sanitized_text"] = text
+    return chunk
+
+def prompt_text(chunk: dict) -> str:
+    # Chunks from older indexes carry no flag and are sanitized on the fly
+    if "sanitized" not in chunk:
+        return sanitize(chunk.get("text", ""))
+    return chunk["sanitized_text"] if chunk["sanitized"] else chunk.get("text", "")
 
 def meets_evidence_threshold(items: List[dict], threshold: float = 0.2) -> bool:
     if not items: 
@@ -28,15 +41,54 @@ def meets_evidence_threshold(items: List[dict], threshold: float = 0.2) -> bool:
     avg_score = mean(scores)
     return avg_score >= threshold
 
-def dedupe_chunks(chunks: List[dict]) -> List[dict]:
-    seen = set(); unique = []
-    for c in chunks:
-        text = c.get("text", "")
-        key = hash(text)
-        if key not in seen:
-            seen.add(key)
-            unique.append(c)
-    return unique
+# Share of the smaller chunk's character shingles found in an earlier chunk
+# above which it is a duplicate. Containment rather than Jaccard, since the
+# same passage exported as .md, .docx and .pdf is chunked at different words.
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.7"))
+# Chunks with fewer shingles count as this many, so short ones (a heading,
+# a one-line answer) are not dropped just for appearing inside a long chunk
+DEDUPE_MIN_SHINGLES = 100
+# LSH bands are tuned to this Jaccard: a short chunk inside one three times
+# its length reaches the containment threshold at about 0.2
+DEDUPE_LSH_JACCARD = 0.2
+# Allowance for the error of a 64-permutation Jaccard estimate
+_JACCARD_SLACK = 0.1
+
+def dedupe_chunks(chunks: List[dict], threshold: float = None) -> List[dict]:
+    # Keeps the first of each group of near-duplicates, so pass chunks best-first.
+    # LSH bands over the MinHash signatures stored at ingest (computed here for
+    # older chunks) pick candidate pairs; pairs whose estimated Jaccard could
+    # reach the threshold containment are checked shingle by shingle.
+    threshold = DEDUPE_THRESHOLD if threshold is None else threshold
+    if len(chunks) < 2:
+        return list(chunks)
+    texts = [c.get("text", "") for c in chunks]
+    sigs = np.array([c["minhash"] if "minhash" in c else default_minhasher.signature(t)
+                     for c, t in zip(chunks, texts)], dtype=np.uint32)
+    later, earlier = band_pairs(sigs, *lsh_params(default_minhasher.num_perm, DEDUPE_LSH_JACCARD))
+    # The lowest Jaccard two sets of these sizes can have at the threshold
+    # containment; text length stands in for the shingle count
+    lengths = np.array([len(t) for t in texts])
+    small = np.maximum(np.minimum(lengths[later], lengths[earlier]), DEDUPE_MIN_SHINGLES)
+    large = np.maximum(lengths[later], lengths[earlier])
+    floor = threshold * small / np.maximum(small + large - threshold * small, 1)
+    likely = similarity(sigs[later], sigs[earlier]) >= floor - _JACCARD_SLACK
+    candidates = {}
+    for i, j in zip(later[likely].tolist(), earlier[likely].tolist()):
+        candidates.setdefault(i, []).append(j)
+
+    shingles = {}
+    def contains(i, j):
+        for k in (i, j):
+            if k not in shingles:
+                shingles[k] = default_minhasher.shingles(texts[k])
+        return containment(shingles[i], shingles[j], DEDUPE_MIN_SHINGLES) >= threshold
+
+    kept = set()
+    for i in range(len(chunks)):
+        if not any(j in kept and contains(i, j) for j in candidates.get(i, ())):
+            kept.add(i)
+    return [c for i, c in enumerate(chunks) if i in kept]
 
 def filter_low_quality_chunks(chunks: List[dict], min_length: int = 50) -> List[dict]:
     return [c for c in chunks if len(c.get("text", "")) >= min_length]
@@ -1,79 +1,306 @@
-﻿import os
+﻿import json, logging, os, time
 from pathlib import Path
-from typing import List, Dict
-from chunking import chunk_text_smart
+from typing import List, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from chunking import iter_chunks
+from retrieval import BM25Index, index_path_for
+from extract_cache import ExtractionCache, default_extraction_cache, file_digest
+from chunk_store import ChunkStore, load_chunks
+from dense import DenseIndex, dense_path_for, get_embedder
+from minhash import default_minhasher
+from guardrails import sanitize_chunk
+from tracing import collect, tracer, write_prometheus_snapshot
+from profiling import profiled
 
+logger = logging.getLogger(__name__)
+
+# Bump when extraction or chunking output changes to invalidate cached entries
+EXTRACTOR_VERSION = "3"
+
+# 0 means one worker per CPU
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+
+# Words of trailing sentences repeated at the start of the next chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))
+
+# Extractors raise on unreadable or corrupt files; file_to_chunks logs the
+# error and records it on the extract span.
 def extract_text_from_txt_md(file_path):
-    try:
-        return Path(file_path).read_text(encoding="utf-8")
-    except Exception as e:
-        print(f"[TXT/MD] Error {file_path}: {e}")
-        return ""
+    return Path(file_path).read_text(encoding="utf-8")
 
 def extract_text_from_docx(file_path):
-    try:
-        import docx
-        doc = docx.Document(str(file_path))
-        return "\n".join(p.text for p in doc.paragraphs)
-    except Exception as e:
-        print(f"[DOCX] Error {file_path}: {e}")
-        return ""
+    import docx
+    doc = docx.Document(str(file_path))
+    return "\n".join(p.text for p in doc.paragraphs)
+
+def iter_pdf_pages(file_path):
+    # Yields one page of text at a time; each page's parsed objects are
+    # released before the next is read.
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            t = page.extract_text()
+            page.close()
+            if t: yield t
 
 def extract_text_from_pdf(file_path):
-    try:
-        import pdfplumber
-        text = []
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                t = page.extract_text()
-                if t: text.append(t)
-        return "\n".join(text)
-    except Exception as e:
-        print(f"[PDF] Error {file_path}: {e}")
-        return ""
+    return "\n".join(iter_pdf_pages(file_path))
 
 def extract_text_from_image(file_path):
-    try:
-        from PIL import Image
-        import pytesseract
-        return pytesseract.image_to_string(Image.open(file_path))
-    except Exception as e:
-        print(f"[IMAGE/OCR] Error {file_path}: {e}")
-        return ""
-
-def file_to_chunks(file_path: Path) -> List[Dict]:
+    from PIL import Image
+    import pytesseract
+    return pytesseract.image_to_string(Image.open(file_path))
+
+def extract_text(file_path: Path) -> str:
     ext = file_path.suffix.lower()
-    content = ""
     if ext in [".txt", ".md"]:
-        content = extract_text_from_txt_md(file_path)
+        return extract_text_from_txt_md(file_path)
     elif ext == ".pdf":
-        content = extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path)
     elif ext == ".docx":
-        content = extract_text_from_docx(file_path)
+        return extract_text_from_docx(file_path)
     elif ext in [".png", ".jpg", ".jpeg"]:
-        content = extract_text_from_image(file_path)
-    if not content:
-        return []
-    chunks = chunk_text_smart(content)
-    return [{
-        "text": c,
+        return extract_text_from_image(file_path)
+    return ""
+
+def _timed(iterable, seconds):
+    # Adds the time spent producing each item to seconds[0]
+    it = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            seconds[0] += time.perf_counter() - start
+            return
+        seconds[0] += time.perf_counter() - start
+        yield item
+
+def _collected(iterable, texts):
+    for item in iterable:
+        texts.append(item)
+        yield item
+
+def iter_file_chunks(file_path: Path, extract_seconds=None, texts=None):
+    # PDFs are chunked page by page as they are parsed; other types are
+    # extracted whole first. Offsets index the extracted text (pages joined by "\n").
+    # extract_seconds, a one-item list, accumulates the time spent in extractors;
+    # texts, a list, collects the extracted pages.
+    extract_seconds = [0.0] if extract_seconds is None else extract_seconds
+    texts = [] if texts is None else texts
+    if file_path.suffix.lower() == ".pdf":
+        pages = _collected(_timed(iter_pdf_pages(file_path), extract_seconds), texts)
+        yield from iter_chunks(pages, overlap=CHUNK_OVERLAP)
+        return
+    start = time.perf_counter()
+    content = extract_text(file_path)
+    extract_seconds[0] += time.perf_counter() - start
+    if content:
+        texts.append(content)
+        yield from iter_chunks([content], overlap=CHUNK_OVERLAP)
+
+def file_to_chunks(file_path: Path, cache: Optional[ExtractionCache] = None,
+                   digest: Optional[str] = None) -> List[Dict]:
+    # digest is file_digest(file_path) when the caller already computed it
+    kind, start = file_path.suffix.lower().lstrip("."), time.perf_counter()
+    key = cache.key(file_path, digest) if cache else None
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+        tracer.record("extract", (time.perf_counter() - start) * 1000, "cache_hit",
+                      type=kind, source=file_path.name, chunks=len(entry["chunks"]))
+    else:
+        extract_seconds, texts, error = [0.0], [], {}
+        try:
+            chunks = list(iter_file_chunks(file_path, extract_seconds, texts))
+        except Exception as e:
+            # One unreadable file is skipped, not the whole ingest
+            logger.warning("Could not extract %s: %s: %s", file_path.name, type(e).__name__, e)
+            chunks, error = [], {"error": type(e).__name__}
+        chunk_ms = (time.perf_counter() - start - extract_seconds[0]) * 1000
+        outcome = "ok" if chunks else "empty"
+        size = file_path.stat().st_size if file_path.exists() else 0
+        tracer.record("extract", extract_seconds[0] * 1000, "error" if error else outcome,
+                      type=kind, source=file_path.name, bytes=size, **error)
+        tracer.record("chunk", chunk_ms, outcome, type=kind, source=file_path.name, chunks=len(chunks),
+                      chars=sum(len(c["text"]) for c in chunks))
+        if not chunks:
+            # Not cached: errors may be transient
+            return []
+        entry = {"text": "\n".join(texts), "chunks": chunks}
+        if cache:
+            cache.put(key, entry)
+    return [sanitize_chunk({
+        "text": c["text"],
         "source": file_path.name,
         "chunk_id": idx,
-        "char_count": len(c),
-        "word_count": len(c.split()),
-    } for idx, c in enumerate(chunks) if c.strip()]
-
-def ingest_files(files: List[Path]):
-    all_chunks = []
-    for file in files:
-        all_chunks += file_to_chunks(file)
+        "char_count": len(c["text"]),
+        "word_count": len(c["text"].split()),
+        "start": c["start"],
+        "end": c["end"],
+        # Near-duplicate detection at query time reuses this signature
+        "minhash": default_minhasher.signature(c["text"]).tolist(),
+    }) for idx, c in enumerate(entry["chunks"])]
+
+def ingest_files(files: List[Path], workers: Optional[int] = None, cache=None, digests=None):
+    # workers > 1 spreads extraction over a process pool; results keep input
+    # order, so chunk lists (and their per-file chunk_ids) are deterministic.
+    # cache=None uses the default on-disk extraction cache, cache=False disables it.
+    # digests, parallel to files, are reused for the cache keys.
+    files = [Path(f) for f in files]
+    digests = list(digests) if digests is not None else [None] * len(files)
+    if cache is None:
+        cache = default_extraction_cache(EXTRACTOR_VERSION)
+    cache = cache or None
+    workers = INGEST_WORKERS if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    with tracer.span("ingest", files=len(files), workers=max(workers, 1)) as span:
+        if workers <= 1:
+            results = (file_to_chunks(f, cache, digest) for f, digest in zip(files, digests))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = []
+                for chunks, spans in pool.map(partial(_file_to_chunks_traced, cache=cache), files, digests):
+                    tracer.replay(spans)
+                    results.append(chunks)
+        all_chunks = []
+        for chunks in results:
+            all_chunks += chunks
+        span.set(chunks=len(all_chunks))
+    if cache:
+        cache.evict()
     return all_chunks
 
+def _file_to_chunks_traced(file_path: Path, digest=None, cache=None):
+    # Pool workers hand their spans back so the parent's metrics include them
+    with collect() as spans:
+        chunks = file_to_chunks(file_path, cache, digest)
+    return chunks, spans
+
+def docs_path_for(chunks_path) -> Path:
+    # data/index.bin -> data/index.docs.json (source name -> content digest)
+    p = Path(chunks_path)
+    return p.with_name(f"{p.stem}.docs.json")
+
+def _load_docs(chunks_path):
+    # (source name -> {"digest", "chunks", "path"}, extractor version), or
+    # ({}, None) when the manifest is missing or unreadable
+    try:
+        data = json.loads(docs_path_for(chunks_path).read_text(encoding="utf-8"))
+        return dict(data["docs"]), data.get("extractor")
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, None
+
+def update_index(files: List[Path], chunks_path="data/index.bin", workers: Optional[int] = None,
+                 rebuild=False, prune=False):
+    """Adds or replaces `files` in the persisted index at chunks_path.
+
+    Only new or changed files (by content digest; every file with rebuild)
+    are extracted and their old chunks dropped; the BM25 (and, with
+    EMBEDDER set, dense) index is updated in place. Other indexed documents
+    are kept unless prune is set, which makes the index hold exactly `files`.
+    After an extractor version bump they are re-extracted from the paths
+    recorded at ingest; those whose file is gone are dropped and counted in
+    "removed". Returns a summary dict.
+    """
+    chunks_path = Path(chunks_path)
+    files = {Path(f).name: Path(f) for f in files}
+    old = []
+    if chunks_path.exists():
+        store = load_chunks(chunks_path)
+        old = store.to_list() if isinstance(store, ChunkStore) else store
+        if isinstance(store, ChunkStore):
+            store.close()
+    docs, extractor = _load_docs(chunks_path) if old else ({}, EXTRACTOR_VERSION)
+    lost = []
+    if extractor != EXTRACTOR_VERSION:
+        # Unknown digests: the indexed sources are taken from the chunks, and
+        # each is re-extracted when it is next listed
+        paths = {name: d.get("path") for name, d in docs.items()}
+        docs = {}
+        for c in old:
+            docs.setdefault(c.get("source"), {"digest": None, "chunks": 0})["chunks"] += 1
+        if extractor is not None:
+            # Chunks from an older extractor are redone now
+            for name in docs:
+                if name not in files and paths.get(name) and Path(paths[name]).is_file():
+                    files[name] = Path(paths[name])
+            lost = [name for name in docs if name not in files]
+            if lost:
+                logger.warning("Dropping %d document(s) indexed by an older extractor whose files are gone: %s",
+                               len(lost), ", ".join(sorted(lost)))
+    digests = {name: file_digest(f) for name, f in files.items()}
+    changed = [name for name in files if rebuild or docs.get(name, {}).get("digest") != digests[name]]
+    vanished = [name for name in docs if name not in files] if prune else lost
+    removed = set(vanished) | (set(changed) & set(docs))
+    summary = {"files": len(files), "changed": len(changed), "removed": len(vanished)}
+    if not removed and not changed:
+        return dict(summary, chunks=sum(d["chunks"] for d in docs.values()), empty=[], sanitized=[])
+    added = ingest_files([files[name] for name in changed], workers=workers,
+                         digests=[digests[name] for name in changed])
+    kept = [c for c in old if c.get("source") not in removed]
+    chunks = kept + added
+
+    index = None
+    if old:
+        try:
+            index = BM25Index.load(index_path_for(chunks_path), old)
+        except (OSError, ValueError, KeyError):
+            pass
+    if index is None:
+        index = BM25Index.build(chunks)
+    else:
+        for name in removed:
+            index.remove(name)
+        index.add(added)
+    chunks_path.parent.mkdir(parents=True, exist_ok=True)
+    ChunkStore.write(chunks_path, chunks)
+    index.save(index_path_for(chunks_path))
+    if os.getenv("EMBEDDER"):
+        # Dense vectors are embedded in batches and persisted next to the chunks
+        embedder, dense = get_embedder(), None
+        if old:
+            try:
+                dense = DenseIndex.load(dense_path_for(chunks_path), old, embedder)
+            except (OSError, ValueError, KeyError, RuntimeError):
+                pass
+        if dense is None:
+            dense = DenseIndex.build(chunks, embedder, kind=os.getenv("DENSE_INDEX_KIND", "flat"))
+        else:
+            for name in removed:
+                dense.remove(name)
+            dense.add(added)
+        if dense.index is not None:
+            dense.save(dense_path_for(chunks_path))
+    else:
+        # Not updated here, so drop it; the next dense query rebuilds it
+        for path in (dense_path_for(chunks_path), Path(f"{dense_path_for(chunks_path)}.json")):
+            path.unlink(missing_ok=True)
+
+    # Files that gave no text stay out of the manifest so the next run retries them
+    docs = {name: d for name, d in docs.items() if name not in removed}
+    for c in added:
+        docs.setdefault(c["source"], {"digest": digests[c["source"]], "chunks": 0})["chunks"] += 1
+    for name in docs.keys() & files.keys():
+        docs[name]["path"] = str(files[name].resolve())
+    docs_path_for(chunks_path).write_text(json.dumps(
+        {"extractor": EXTRACTOR_VERSION, "docs": docs}, ensure_ascii=False, indent=1), encoding="utf-8")
+    return dict(summary, chunks=len(chunks), empty=sorted(set(changed) - set(docs)),
+                sanitized=sorted({c["source"] for c in added if c["sanitized"]}))
 
 if __name__ == "__main__":
-    import sys, json
+    import sys
+    # python ingest.py <folder> [chunks path]; see cli.py for the full command line
     folder = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("sample_docs")
-    chunks = ingest_files(list(folder.glob("*")))
-    with open("data/index.json", "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
-    print(f"[Ingest] {folder} processed.")
\ No newline at end of file
+    chunks_path = sys.argv[2] if len(sys.argv) > 2 else "data/index.bin"
+    # PROFILE_RATE=1 profiles the run; with INGEST_WORKERS > 1 extraction
+    # happens in pool workers, which cProfile does not see.
+    with profiled("ingest") as profile:
+        summary = update_index([f for f in folder.glob("*") if f.is_file()], chunks_path, prune=True)
+    if summary["sanitized"]:
+        print(f"[Ingest] Removed injection-like lines from: {', '.join(summary['sanitized'])}")
+    if profile:
+        print(f"[Ingest] Profile written to {profile['pstats']} and {profile['alloc']}")
+    write_prometheus_snapshot()
+    print(f"[Ingest] {folder} processed: {summary['changed']} new or changed, "
+          f"{summary['removed']} removed, {summary['chunks']} chunks in {chunks_path}.")
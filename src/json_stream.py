@@ -0,0 +1,93 @@
+import json, re
+
+_SPECIAL = re.compile(r'[{}\[\]"\\]')
+# strict=False lets raw newlines and tabs inside strings through, as models emit them
+_DECODER = json.JSONDecoder(strict=False)
+
+def extract_json_objects(text: str):
+    """Every top-level JSON object in `text`, in order, in one pass.
+
+    Same notion of top-level as JSONObjectStream. Each candidate object is
+    handed to raw_decode once and scanning resumes after it, so the cost
+    stays linear even on truncated or malformed output; an object that
+    fails to decode is skipped by tracking its nesting instead.
+    """
+    out, stack, in_str = [], [], False
+    pos = 0
+    while True:
+        m = _SPECIAL.search(text, pos)
+        if m is None:
+            return out
+        i, ch = m.start(), m.group()
+        pos = i + 1
+        if in_str:
+            if ch == '\\':
+                pos = i + 2
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = bool(stack)
+        elif ch in '{[':
+            if ch == '{' and stack in ([], ['[']):
+                try:
+                    obj, end = _DECODER.raw_decode(text, i)
+                except ValueError:
+                    pass
+                else:
+                    out.append(obj)
+                    pos = end
+                    continue
+            stack.append(ch)
+        elif stack and stack[-1] == ('{' if ch == '}' else '['):
+            stack.pop()
+
+class JSONObjectStream:
+    """Incrementally pulls top-level JSON objects out of streamed LLM text.
+
+    feed() takes the next piece of text and returns every object whose
+    closing brace arrived in it. Objects count as top-level when they sit
+    directly in the outermost array or outside any array; prose around the
+    JSON is skipped. Objects that fail to parse are dropped.
+    """
+    def __init__(self):
+        self._stack = []
+        self._in_str = False
+        self._esc = False
+        self._parts = None   # text of the object being captured
+
+    def feed(self, text: str):
+        out = []
+        skip = 1 if self._esc else 0
+        self._esc = False
+        cap_start = 0 if self._parts is not None else None
+        for m in _SPECIAL.finditer(text):
+            i, ch = m.start(), m.group()
+            if i < skip:
+                continue
+            if self._in_str:
+                if ch == '\\':
+                    if i + 1 < len(text):
+                        skip = i + 2
+                    else:
+                        self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = bool(self._stack)
+            elif ch in '{[':
+                if ch == '{' and self._parts is None and self._stack in ([], ['[']):
+                    self._parts, cap_start = [], i
+                self._stack.append(ch)
+            elif ch in '}]' and self._stack and self._stack[-1] == ('{' if ch == '}' else '['):
+                self._stack.pop()
+                if ch == '}' and self._parts is not None and self._stack in ([], ['[']):
+                    self._parts.append(text[cap_start:i + 1])
+                    try:
+                        out.append(json.loads(''.join(self._parts)))
+                    except ValueError:
+                        pass
+                    self._parts, cap_start = None, None
+        if self._parts is not None:
+            self._parts.append(text[cap_start:])
+        return out
@@ -0,0 +1,83 @@
+import hashlib, json, os, sqlite3, threading, time
+from pathlib import Path
+from typing import Optional
+
+class LLMCache:
+    """SQLite-backed cache of raw LLM completions.
+
+    Entries expire after ttl seconds; past max_entries the least recently
+    read ones are dropped.
+    """
+    def __init__(self, path, ttl: float = 7 * 86400, max_entries: int = 5000):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(**params) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_default = None
+_default_pid = None
+
+def default_llm_cache() -> Optional[LLMCache]:
+    # LLM_CACHE_PATH="" disables caching; one connection per process
+    global _default, _default_pid
+    path = os.getenv("LLM_CACHE_PATH", "data/cache/llm.sqlite3")
+    if not path:
+        return None
+    if _default is None or _default_pid != os.getpid():
+        _default = LLMCache(
+            path,
+            ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 86400))),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+        )
+        _default_pid = os.getpid()
+    return _default
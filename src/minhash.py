@@ -0,0 +1,75 @@
+import re
+import numpy as np
+
+_NON_ALNUM = re.compile(r'[\W_]+')
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX32 = np.uint64(0xFFFFFFFF)
+# Odd multipliers combining a band's values into one key (uint64 wrap-around)
+_BAND_MULTIPLIERS = np.random.RandomState(7).randint(1, 1 << 62, size=64).astype(np.uint64) | np.uint64(1)
+
+def _sorted_unique(values):
+    # np.unique without its overhead, for the small arrays used here
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+class MinHasher:
+    """MinHash signatures over character shingles of normalized text.
+
+    Text is lowercased with punctuation and whitespace runs collapsed, so
+    the same content exported as .md, .docx or OCR'd .png lands close.
+    """
+    def __init__(self, num_perm=64, shingle=5, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm, self.shingle = num_perm, shingle
+        # a < 2^31 keeps a * h + b (h < 2^32) inside uint64
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self._powers = np.uint64(1000003) ** np.arange(shingle - 1, -1, -1, dtype=np.uint64)
+
+    def shingles(self, text):
+        norm = _NON_ALNUM.sub(' ', str(text).lower()).strip()
+        codes = np.frombuffer(norm.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        if len(codes) < self.shingle:
+            codes = np.pad(codes, (0, self.shingle - len(codes)))
+        # Polynomial hash per window (uint64 wrap-around), folded to 32 bits
+        n = len(codes) - self.shingle + 1
+        h = codes[:n] * self._powers[0]
+        for j in range(1, self.shingle):
+            h += codes[j:j + n] * self._powers[j]
+        return _sorted_unique(h & _MAX32)
+
+    def signature(self, text):
+        h = self.shingles(text)
+        return (((np.outer(self.a, h) + self.b[:, None]) % _PRIME) & _MAX32).min(axis=1).astype(np.uint32)
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures
+    (row by row for 2-D arrays)."""
+    return np.mean(np.asarray(sig_a) == np.asarray(sig_b), axis=-1)
+
+def containment(shingles_a, shingles_b, min_size=1):
+    """Shared shingles over the smaller set (1.0: one text lies inside the other).
+
+    Unlike Jaccard it stays high when two copies of a passage were cut at
+    different words. Sets smaller than min_size count as min_size.
+    """
+    shared = len(np.intersect1d(shingles_a, shingles_b, assume_unique=True))
+    return shared / max(min(len(shingles_a), len(shingles_b)), min_size, 1)
+
+def lsh_params(num_perm, threshold):
+    # (bands, rows) whose S-curve midpoint (1/bands)^(1/rows) sits closest
+    # below the threshold, so true near-duplicates are rarely missed
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    below = [o for o in options if (1 / o[0]) ** (1 / o[1]) <= threshold] or options[:1]
+    return max(below, key=lambda o: (1 / o[0]) ** (1 / o[1]))
+
+def band_pairs(signatures, bands, rows):
+    """LSH banding: (i, j) index arrays, i > j, of signatures (one per row)
+    that agree on every value of at least one band. Sized for candidate
+    lists; each band's values are hashed to one uint64 key."""
+    sigs = np.asarray(signatures, dtype=np.uint64)[:, :bands * rows].reshape(len(signatures), bands, rows)
+    keys = (sigs * _BAND_MULTIPLIERS[:rows]).sum(axis=2)
+    shared = (keys[:, None, :] == keys[None, :, :]).any(axis=2)
+    return np.nonzero(np.tril(shared, -1))
+
+default_minhasher = MinHasher()
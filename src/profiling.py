@@ -0,0 +1,117 @@
+import cProfile, os, random, threading, time, tracemalloc, uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+# Opt-in CPU and memory profiling of whole ingest or query runs.
+# PROFILE_RATE is the fraction of runs profiled (0 = off, 1 = every run),
+# so a low rate can stay on in production. Each sampled run writes
+# <kind>-<request id>.pstats and <kind>-<request id>.alloc.txt to PROFILE_DIR.
+PROFILE_RATE = float(os.getenv("PROFILE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))
+PROFILE_FRAMES = int(os.getenv("PROFILE_FRAMES", "10"))
+# How often traced memory is polled for a new peak
+PROFILE_SAMPLE_SECONDS = float(os.getenv("PROFILE_SAMPLE_SECONDS", "0.05"))
+
+# cProfile allows one active profiler per interpreter; runs that start
+# while another is profiled (nested or concurrent) are not sampled.
+_active = threading.Lock()
+
+def configure(rate=None, out_dir=None):
+    # CLI switches override the environment
+    global PROFILE_RATE, PROFILE_DIR
+    if rate is not None:
+        PROFILE_RATE = rate
+    if out_dir is not None:
+        PROFILE_DIR = out_dir
+
+def new_request_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+class _PeakSampler(threading.Thread):
+    # Polls traced memory and snapshots whenever it passes the last snapshot
+    # by 5%, so the report shows what was held near the peak rather than
+    # what is left at the end. The step bounds how often a large heap is walked.
+    def __init__(self, interval):
+        super().__init__(name="profile-peak-sampler", daemon=True)
+        self.interval, self.done = interval, threading.Event()
+        self.size, self.snapshot = 0, None
+
+    def sample(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.size * 1.05:
+            self.snapshot, self.size = tracemalloc.take_snapshot(), current
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.sample()
+
+def _write_alloc_report(path, start, sampler, peak, current, elapsed):
+    stats = sorted(sampler.snapshot.compare_to(start, "lineno"), key=lambda s: s.size_diff, reverse=True)
+    lines = [
+        f"peak traced memory: {peak / 2**20:.1f} MiB, still allocated at end: {current / 2**20:.1f} MiB",
+        f"wall time: {elapsed:.3f}s (tracemalloc counts allocations from every thread)",
+        "",
+        f"top {PROFILE_TOP} allocation sites at the peak snapshot ({sampler.size / 2**20:.1f} MiB traced), "
+        "by growth since the run started:",
+    ]
+    for stat in stats[:PROFILE_TOP]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  {frame.filename}:{frame.lineno}")
+    if stats:
+        lines += ["", "largest site, call stack:"]
+        lines += [f"  {line}" for line in stats[0].traceback.format()]
+    Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+@contextmanager
+def profiled(kind, request_id=None, rate=None):
+    """Profiles the block with cProfile and tracemalloc when sampled.
+
+    Yields a dict with request_id and the output paths, or None when the
+    run is not sampled. Only the calling thread is profiled by cProfile.
+    """
+    rate = PROFILE_RATE if rate is None else rate
+    if rate <= 0 or random.random() >= rate or not _active.acquire(blocking=False):
+        yield None
+        return
+    try:
+        request_id = request_id or new_request_id()
+        out_dir = Path(PROFILE_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        info = {
+            "request_id": request_id,
+            "pstats": str(out_dir / f"{kind}-{request_id}.pstats"),
+            "alloc": str(out_dir / f"{kind}-{request_id}.alloc.txt"),
+        }
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(PROFILE_FRAMES)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.take_snapshot()
+        sampler = _PeakSampler(PROFILE_SAMPLE_SECONDS)
+        sampler.size = tracemalloc.get_traced_memory()[0]
+        sampler.start()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield info
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            current, peak = tracemalloc.get_traced_memory()
+            if sampler.snapshot is None:
+                # Never grew past the starting level
+                sampler.snapshot, sampler.size = tracemalloc.take_snapshot(), current
+            if started:
+                tracemalloc.stop()
+            profile.dump_stats(info["pstats"])
+            _write_alloc_report(info["alloc"], baseline, sampler, peak, current, elapsed)
+    finally:
+        _active.release()
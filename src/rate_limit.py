@@ -0,0 +1,41 @@
+import threading, time
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate_per_minute.
+
+    reserve() always succeeds and returns how long the caller must wait;
+    a request bigger than what is left puts the bucket into debt, so
+    callers are served in arrival order.
+    """
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for LLM calls."""
+    def __init__(self, rpm: float = None, tpm: float = None, sleep=time.sleep):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.sleep = sleep
+        self.waited = 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        wait = max(
+            self.requests.reserve(1) if self.requests else 0.0,
+            self.tokens.reserve(tokens) if self.tokens and tokens else 0.0,
+        )
+        if wait > 0:
+            self.waited += wait
+            self.sleep(wait)
+        return wait
@@ -1,24 +1,315 @@
-﻿from rank_bm25 import BM25Okapi
-from nltk.stem import PorterStemmer
-import re
-
-_ps = PorterStemmer()
+﻿from analyzer import default_analyzer
+from chunk_store import ChunkStore, load_chunks
+from dense import dense_retrieve_many
+from guardrails import dedupe_chunks
+from tracing import tracer
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import json, math, os
 
 def _normalize_text(text: str):
-    words = re.sub(r'[^\w\s]', '', str(text)).lower().split()
-    return ' '.join(_ps.stem(w) for w in words)
-
-def retrieve(query, file_chunks, top_k=5):
-    tokenized = [_normalize_text(c['text']).split() for c in file_chunks if c['text'].strip()]
-    if not tokenized:
-        return []
-    bm25 = BM25Okapi(tokenized)
-    query_tokens = _normalize_text(query).split()
-    scores = bm25.get_scores(query_tokens)
-    min_score, max_score = float(min(scores)), float(max(scores))
-    norm = [(s-min_score)/(max_score-min_score) if max_score>min_score else 0 for s in scores]
-    indices = sorted(range(len(norm)), key=lambda i: norm[i], reverse=True)[:top_k]
+    return ' '.join(default_analyzer.tokens(text))
+
+def _tokenize(text: str):
+    return default_analyzer.tokens(text)
+
+def index_path_for(chunks_path) -> Path:
+    # data/index.bin -> data/index.bm25.json
+    p = Path(chunks_path)
+    return p.with_name(f"{p.stem}.bm25.json")
+
+class BM25Index:
+    """Okapi BM25 over chunk dicts, built once and updated in place.
+
+    Scores match rank_bm25.BM25Okapi for the same corpus and parameters.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, k1=1.5, b=0.75, epsilon=0.25, analyzer=None):
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.analyzer = analyzer or default_analyzer
+        self.store = None
+        self._reset()
+
+    def _reset(self):
+        self.chunks = []      # slot -> chunk dict, or position in self.store until read
+        self.keys = []        # slot -> (source, chunk_id)
+        self.doc_terms = []   # slot -> {term: tf}
+        self.doc_len = []     # slot -> token count
+        self.postings = {}    # term -> {slot: tf}
+        self.total_len = 0
+        self._stats = None
+
+    @classmethod
+    def build(cls, chunks, **params):
+        with tracer.span("index_build", kind="bm25") as span:
+            index = cls(**params)
+            span.set(chunks=index.add(chunks))
+        return index
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def sources(self):
+        return sorted({source for source, _ in self.keys})
+
+    def add(self, chunks):
+        added = 0
+        for c in chunks:
+            if not c.get("text", "").strip():
+                continue
+            tf = Counter(self.analyzer.tokens(c["text"]))
+            self._add_slot(c, (c.get("source"), c.get("chunk_id")), dict(tf), sum(tf.values()))
+            added += 1
+        return added
+
+    def _add_slot(self, chunk, key, tf, length):
+        slot = len(self.chunks)
+        self.chunks.append(chunk)
+        self.keys.append(key)
+        self.doc_terms.append(tf)
+        self.doc_len.append(length)
+        for term, n in tf.items():
+            self.postings.setdefault(term, {})[slot] = n
+        self.total_len += length
+        self._stats = None
+
+    def remove(self, source):
+        # Slots are compacted right away so scores never see removed docs;
+        # stored term counts are reused, nothing is re-tokenized.
+        keep = [i for i, key in enumerate(self.keys) if key[0] != source]
+        removed = len(self.chunks) - len(keep)
+        if removed:
+            chunks, keys, terms, lens = self.chunks, self.keys, self.doc_terms, self.doc_len
+            self._reset()
+            for i in keep:
+                self._add_slot(chunks[i], keys[i], terms[i], lens[i])
+        return removed
+
+    def chunk(self, slot):
+        c = self.chunks[slot]
+        if isinstance(c, int):
+            c = self.chunks[slot] = self.store[c]
+        return c
+
+    def _ensure_stats(self):
+        if self._stats is not None:
+            return self._stats
+        n = len(self.chunks)
+        idf = {t: math.log(n - len(p) + 0.5) - math.log(len(p) + 0.5) for t, p in self.postings.items()}
+        eps = self.epsilon * sum(idf.values()) / len(idf) if idf else 0.0
+        idf = {t: v if v >= 0 else eps for t, v in idf.items()}
+        avgdl = self.total_len / n if n else 0.0
+        doc_len = np.asarray(self.doc_len, dtype=np.float64)
+        len_norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl) if avgdl else np.full(n, self.k1)
+        self._stats = {"idf": idf, "len_norm": len_norm, "arrays": {}}
+        return self._stats
+
+    def _posting_arrays(self, term):
+        stats = self._ensure_stats()
+        arrays = stats["arrays"].get(term)
+        if arrays is None:
+            posting = self.postings[term]
+            arrays = (np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                      np.fromiter(posting.values(), dtype=np.float64, count=len(posting)))
+            stats["arrays"][term] = arrays
+        return arrays
+
+    def _term_weights(self, term):
+        # Per-posting BM25 contribution of one occurrence of `term` in a query
+        stats = self._ensure_stats()
+        slots, tf = self._posting_arrays(term)
+        return slots, stats["idf"][term] * (tf * (self.k1 + 1) / (tf + stats["len_norm"][slots]))
+
+    def get_scores(self, query_tokens):
+        return self.get_batch_scores([query_tokens])[0]
+
+    def get_batch_scores(self, token_lists):
+        # Each query term's postings are scored once per batch and scattered
+        # into every query row that uses it.
+        scores = np.zeros((len(token_lists), len(self.chunks)))
+        rows_by_term = {}
+        for row, tokens in enumerate(token_lists):
+            for term, n in Counter(tokens).items():
+                if term in self.postings:
+                    rows_by_term.setdefault(term, []).append((row, n))
+        for term, rows in rows_by_term.items():
+            slots, weights = self._term_weights(term)
+            row_ids, counts = zip(*rows)
+            scores[np.ix_(row_ids, slots)] += np.outer(counts, weights)
+        return scores
+
+    def save(self, path):
+        data = {
+            "version": self.FORMAT_VERSION,
+            "params": {"k1": self.k1, "b": self.b, "epsilon": self.epsilon},
+            "docs": [
+                {"source": source, "chunk_id": chunk_id, "len": n, "tf": tf}
+                for (source, chunk_id), tf, n in zip(self.keys, self.doc_terms, self.doc_len)
+            ],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, chunks, analyzer=None):
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("version") != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index version in {path}")
+        index = cls(analyzer=analyzer, **data["params"])
+        if isinstance(chunks, ChunkStore):
+            # Slots point into the store; text is decoded only for returned hits
+            index.store = chunks
+            by_key = {key: pos for pos, key in enumerate(chunks.keys())}
+            expected = len(chunks)
+        else:
+            by_key = {(c.get("source"), c.get("chunk_id")): c for c in chunks}
+            expected = sum(1 for c in chunks if c.get("text", "").strip())
+        for doc in data["docs"]:
+            key = (doc["source"], doc["chunk_id"])
+            if key not in by_key:
+                raise ValueError(f"Index {path} is stale: missing chunk {key[0]}#{key[1]}")
+            index._add_slot(by_key[key], key, doc["tf"], doc["len"])
+        if len(index) != expected:
+            raise ValueError(f"Index {path} is stale: chunk count differs")
+        return index
+
+def load_index(chunks_path="data/index.bin"):
+    chunks = load_chunks(chunks_path)
+    index_path = index_path_for(chunks_path)
+    try:
+        index = BM25Index.load(index_path, chunks)
+    except (OSError, ValueError, KeyError):
+        index = BM25Index.build(chunks)
+        index.save(index_path)
+    return chunks, index
+
+def _top_k(norm, top_k, min_score=0.1):
+    # Per row: everything scoring at least the k-th best value (ties included)
+    # is kept, ordered by score desc, slot asc, then cut to k
+    n = norm.shape[1]
+    k = min(top_k, n)
+    if k <= 0:
+        return [[] for _ in range(norm.shape[0])]
+    results = []
+    for row in norm:
+        kth = np.partition(row, n - k)[n - k] if k < n else -np.inf
+        idx = np.flatnonzero((row >= kth) & (row > min_score))
+        idx = idx[np.lexsort((idx, -row[idx]))][:k]
+        results.append([(int(i), float(row[i])) for i in idx])
+    return results
+
+def _min_max(scores):
+    # In place: score matrices can be large
+    lo = scores.min(axis=1, keepdims=True)
+    span = scores.max(axis=1, keepdims=True) - lo
+    scores -= lo
+    np.divide(scores, span, out=scores, where=span > 0)
+    return scores
+
+# Reciprocal-rank fusion: each scorer contributes weight / (rrf_k + rank) for
+# the chunks in its own bounded candidate list.
+HYBRID_DEFAULTS = {
+    "rrf_k": 60,
+    "bm25_weight": 1.0,
+    "dense_weight": 1.0,
+    "bm25_candidates": 50,
+    "dense_candidates": 50,
+}
+
+# Upper bound on scores held at once (queries x chunks, float64): 2**24 is 128 MiB
+SCORE_BUDGET = int(os.getenv("BM25_SCORE_BUDGET", str(2**24)))
+
+def _bm25_many(queries, index, top_k, batch_size, min_score=0.1):
+    # Fewer queries per batch on big corpora, so the score matrix stays in budget
+    batch_size = max(1, min(batch_size, SCORE_BUDGET // max(len(index), 1)))
+    results = []
+    for start in range(0, len(queries), batch_size):
+        batch = [index.analyzer.tokens(q) for q in queries[start:start + batch_size]]
+        norm = _min_max(index.get_batch_scores(batch))
+        results += [
+            [dict(index.chunk(idx), score=score) for idx, score in hits]
+            for hits in _top_k(norm, top_k, min_score)
+        ]
+    return results
+
+def _fuse(ranked_lists, weights, rrf_k, top_k):
+    # Scores are scaled by the best possible fused score, so a chunk ranked
+    # first by every scorer gets 1.0 and evidence thresholds keep their meaning.
+    fused = {}
+    for (name, hits), weight in zip(ranked_lists, weights):
+        if weight == 0:
+            continue
+        for rank, hit in enumerate(hits, 1):
+            key = (hit.get("source"), hit.get("chunk_id"))
+            entry = fused.setdefault(key, {"chunk": hit, "score": 0.0})
+            entry["score"] += weight / (rrf_k + rank)
+            entry[f"{name}_rank"] = rank
+    best = sum(w for w in weights if w > 0) / (rrf_k + 1)
+    ranked = sorted(fused.values(), key=lambda e: -e["score"])[:top_k]
+    return [
+        dict(e["chunk"], score=e["score"] / best,
+             **{k: v for k, v in e.items() if k.endswith("_rank")})
+        for e in ranked
+    ]
+
+# Candidates fetched per requested hit, so dropped near-duplicates can be backfilled
+DEDUPE_OVERFETCH = 3
+
+def _ranked_many(queries, file_chunks, top_k, index, batch_size, mode, dense_index, hybrid):
+    if mode in ("dense", "hybrid") and dense_index is None:
+        raise ValueError(f"mode={mode!r} needs a dense_index")
+    if mode == "dense":
+        return dense_retrieve_many(queries, dense_index, top_k=top_k)
+    if index is None:
+        index = BM25Index.build(file_chunks)
+    if mode == "bm25":
+        return _bm25_many(queries, index, top_k, batch_size) if len(index) else [[] for _ in queries]
+    if mode != "hybrid":
+        raise ValueError(f"Unknown retrieval mode {mode!r}")
+    params = {**HYBRID_DEFAULTS, **(hybrid or {})}
+    weights = (params["bm25_weight"], params["dense_weight"])
+    if any(w < 0 for w in weights) or not any(w > 0 for w in weights):
+        raise ValueError(f"Hybrid weights must be >= 0 with at least one > 0, got {weights}")
+    lexical = (_bm25_many(queries, index, params["bm25_candidates"], batch_size, min_score=0.0)
+               if len(index) else [[] for _ in queries])
+    semantic = dense_retrieve_many(queries, dense_index, top_k=params["dense_candidates"], min_score=0.0)
     return [
-        dict(file_chunks[idx], score=float(norm[idx]))
-        for idx in indices if norm[idx] > 0.1
+        _fuse([("bm25", lex), ("dense", sem)], weights, params["rrf_k"], top_k)
+        for lex, sem in zip(lexical, semantic)
     ]
+
+def retrieve_many(queries, file_chunks, top_k=5, index=None, batch_size=256,
+                  mode="bm25", dense_index=None, hybrid=None, dedupe=None):
+    # mode="dense" answers from a prebuilt dense.DenseIndex instead of BM25;
+    # mode="hybrid" fuses both, with `hybrid` overriding HYBRID_DEFAULTS.
+    # Near-duplicate hits are dropped: dedupe=None uses DEDUPE_THRESHOLD,
+    # a float sets the containment threshold, dedupe=False keeps them.
+    queries = list(queries)
+    with tracer.span("retrieve", mode=mode, queries=len(queries), top_k=top_k) as span:
+        fetch = top_k if dedupe is False else top_k * DEDUPE_OVERFETCH
+        results = _ranked_many(queries, file_chunks, fetch, index, batch_size, mode, dense_index, hybrid)
+        if dedupe is not False:
+            results = [dedupe_chunks(hits, dedupe)[:top_k] for hits in results]
+        span.set(hits=sum(len(hits) for hits in results))
+    # Signatures are for dedupe only; callers get the chunk fields
+    return [[{k: v for k, v in hit.items() if k != "minhash"} for hit in hits] for hits in results]
+
+def retrieve(query, file_chunks, top_k=5, index=None, mode="bm25", dense_index=None, hybrid=None, dedupe=None):
+    return retrieve_many([query], file_chunks, top_k=top_k, index=index,
+                         mode=mode, dense_index=dense_index, hybrid=hybrid, dedupe=dedupe)[0]
+
+if __name__ == "__main__":
+    import sys
+    queries_path = Path(sys.argv[1])
+    chunks_path = sys.argv[2] if len(sys.argv) > 2 else "data/index.bin"
+    top_k = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    queries = [q.strip() for q in queries_path.read_text(encoding="utf-8").splitlines() if q.strip()]
+    chunks, index = load_index(chunks_path)
+    for query, hits in zip(queries, retrieve_many(queries, chunks, top_k=top_k, index=index)):
+        print(json.dumps({
+            "query": query,
+            "results": [{"source": h.get("source"), "chunk_id": h.get("chunk_id"), "score": round(h["score"], 3)} for h in hits],
+        }, ensure_ascii=False))
@@ -0,0 +1,310 @@
+import sys
+from pathlib import Path
+# `python -m src.server` runs this as src.server; see cli.py
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import argparse, json, logging, os, signal, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from ingest import update_index
+from retrieval import BM25Index, load_index, retrieve_many
+from dense import load_dense_index
+from generate import generate
+from batch import LLM_RPM, LLM_TPM
+from rate_limit import RateLimiter
+from profiling import profiled
+from tracing import collect, tracer
+
+# Usage:
+#   python -m src.server [--port 8000] [--index data/index.bin] [--workers 4] [--queue 32]
+#   curl -d '{"query": "twin bed filters", "top_k": 3}' localhost:8000/retrieve
+#   curl -d '{"query": "Create use cases for hotel filters"}' localhost:8000/generate
+#   curl -d '{"paths": ["sample"]}' localhost:8000/ingest      (paths under --ingest-root; "prune": true to sync)
+#   curl -X POST localhost:8000/reload      (or kill -HUP), GET /health, GET /metrics
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4"))
+# Requests accepted while all workers are busy; beyond that clients get 503
+SERVER_QUEUE = int(os.getenv("SERVER_QUEUE", "32"))
+INGEST_ROOT = os.getenv("INGEST_ROOT", "data")
+MAX_BODY = 1 << 20
+MAX_TOP_K = 50
+
+logger = logging.getLogger(__name__)
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class KnowledgeBase:
+    """The warm index every request shares.
+
+    Readers take the current (chunks, index, dense) state; ingest and reload
+    build a new state off to the side and swap it in, so in-flight requests
+    keep the index they started with.
+    """
+    def __init__(self, chunks_path, mode="bm25", ingest_root=INGEST_ROOT, workers=None):
+        self.chunks_path, self.mode = Path(chunks_path), mode
+        self.ingest_root = Path(ingest_root).resolve()
+        self.workers = workers
+        self._write_lock = threading.Lock()   # one ingest or reload at a time
+        self.state = self._load()
+
+    def _load(self):
+        if not self.chunks_path.exists():
+            chunks, index = [], BM25Index()
+        else:
+            chunks, index = load_index(self.chunks_path)
+        dense = load_dense_index(self.chunks_path, chunks) if self.mode != "bm25" and len(chunks) else None
+        return {"chunks": chunks, "index": index, "dense": dense, "loaded_at": time.time()}
+
+    def retrieve(self, queries, top_k):
+        state = self.state
+        return retrieve_many(queries, state["chunks"], top_k=top_k, index=state["index"],
+                             mode=self.mode if state["dense"] is not None else "bm25", dense_index=state["dense"])
+
+    def reload(self):
+        with self._write_lock:
+            self.state = self._load()
+        return self.info()
+
+    def ingest(self, paths, rebuild=False, prune=False):
+        # Adds or replaces these files; prune also drops indexed files not among them
+        files = []
+        for p in paths:
+            path = (self.ingest_root / p).resolve()
+            if not path.is_relative_to(self.ingest_root):
+                raise HTTPError(403, f"{p} is outside the ingest root")
+            if path.is_dir():
+                files += sorted(f for f in path.glob("*") if f.is_file())
+            elif path.is_file():
+                files.append(path)
+            else:
+                raise HTTPError(400, f"No such file or folder: {p}")
+        with self._write_lock:
+            summary = update_index(files, self.chunks_path, workers=self.workers, rebuild=rebuild, prune=prune)
+            if summary["changed"] or summary["removed"] or not self.chunks_path.exists():
+                self.state = self._load()
+        return {**summary, **self.info()}
+
+    def info(self):
+        state = self.state
+        return {
+            "chunks": len(state["index"]),
+            "documents": len(state["index"].sources),
+            "dense": state["dense"] is not None,
+            "loaded_at": round(state["loaded_at"], 3),
+        }
+
+def _hit(rank, h):
+    return {"rank": rank, "source": h.get("source"), "chunk_id": h.get("chunk_id"),
+            "score": round(h["score"], 4), "text": h.get("text", "")}
+
+def _top_k(body):
+    top_k = body.get("top_k", 5)
+    if not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        raise HTTPError(400, f"top_k must be an integer from 1 to {MAX_TOP_K}")
+    return top_k
+
+def _query(body):
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise HTTPError(400, "query must be a non-empty string")
+    return query
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "rag-service/1"
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def _send(self, status, payload):
+        # bytes go out as plain text (the metrics page), anything else as JSON
+        if isinstance(payload, bytes):
+            data, content_type = payload, "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        return body
+
+    def _dispatch(self, routes):
+        route = routes.get(self.path.split("?", 1)[0])
+        try:
+            if route is None:
+                raise HTTPError(404, f"No route {self.command} {self.path}")
+            self._send(200, route(self))
+        except HTTPError as e:
+            self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            logger.exception("%s %s failed", self.command, self.path)
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._dispatch({"/health": Handler.health, "/metrics": Handler.metrics})
+
+    def do_POST(self):
+        self._dispatch({"/retrieve": Handler.retrieve, "/generate": Handler.generate,
+                        "/ingest": Handler.ingest, "/reload": Handler.reload})
+
+    def health(self):
+        return {"status": "ok", **self.server.kb.info(), "in_flight": self.server.in_flight}
+
+    def metrics(self):
+        return tracer.prometheus().encode("utf-8")
+
+    def retrieve(self):
+        # {"query": str} or {"queries": [str, ...]}, optional "top_k"
+        body = self._body()
+        top_k = _top_k(body)
+        queries = body.get("queries")
+        if queries is None:
+            queries = [_query(body)]
+        elif not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+            raise HTTPError(400, "queries must be a list of non-empty strings")
+        with profiled("query"):
+            results = self.server.kb.retrieve(queries, top_k)
+        out = [{"query": q, "results": [_hit(rank, h) for rank, h in enumerate(hits, 1)]}
+               for q, hits in zip(queries, results)]
+        return out[0] if "queries" not in body else {"results": out}
+
+    def generate(self):
+        # {"query": str}, optional "top_k" and "cache" (false skips the response cache)
+        body = self._body()
+        query, top_k = _query(body), _top_k(body)
+        with profiled("generate"):
+            with collect() as retrieval_spans:
+                evidence = self.server.kb.retrieve([query], top_k)[0]
+            result = self.server.generate(query, evidence, cache=None if body.get("cache", True) else False,
+                                          limiter=self.server.limiter)
+        result["trace"] = retrieval_spans + result.get("trace", [])
+        return result
+
+    def ingest(self):
+        # {"paths": [...], "rebuild": bool, "prune": bool}; only with prune does the
+        # index end up holding exactly these files
+        body = self._body()
+        paths = body.get("paths")
+        if not isinstance(paths, list) or not paths or not all(isinstance(p, str) for p in paths):
+            raise HTTPError(400, "paths must be a non-empty list of paths under the ingest root")
+        return self.server.kb.ingest(paths, rebuild=bool(body.get("rebuild")), prune=bool(body.get("prune")))
+
+    def reload(self):
+        self._body()
+        return self.server.kb.reload()
+
+class _Overloaded(BaseHTTPRequestHandler):
+    # Answers on the accept thread when the queue is full
+    def log_message(self, format, *args):
+        logger.warning("%s rejected, queue full: %s", self.address_string(), format % args)
+
+    def _reject(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= MAX_BODY:
+            self.rfile.read(length)   # unread input would reset the connection before the reply
+        data = b'{"error": "Server busy, retry later"}'
+        self.send_response(503)
+        self.send_header("Retry-After", "1")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _reject
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that handles requests on a fixed pool of worker threads.
+
+    At most workers + queue requests are admitted; the rest get 503 at once
+    instead of piling up. shutdown() stops accepting, close() waits for the
+    admitted requests to finish.
+    """
+    def __init__(self, address, kb, workers=SERVER_WORKERS, queue=SERVER_QUEUE, generate_fn=generate, limiter=None):
+        super().__init__(address, Handler)
+        self.kb, self.generate = kb, generate_fn
+        self.limiter = limiter or RateLimiter(rpm=LLM_RPM, tpm=LLM_TPM)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            request.settimeout(1)   # a slow client must not stall the accept loop
+            try:
+                _Overloaded(request, client_address, self)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        with self._lock:
+            self.in_flight += 1
+        self.pool.submit(self._work, request, client_address)
+
+    def _work(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve retrieval and generation over one warm index.")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8000")))
+    parser.add_argument("--index", default=os.getenv("INDEX_PATH", "data/index.bin"))
+    parser.add_argument("--mode", choices=("bm25", "dense", "hybrid"), default="bm25")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="requests handled at once")
+    parser.add_argument("--queue", type=int, default=SERVER_QUEUE, help="requests waiting for a worker before 503s")
+    parser.add_argument("--ingest-root", default=INGEST_ROOT, help="/ingest paths are resolved under this folder")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if not os.getenv("TRACE_LOG"):
+        # Access logs only; span records stay opt-in via TRACE_LOG
+        logging.getLogger("tracing").setLevel(logging.WARNING)
+
+    kb = KnowledgeBase(args.index, mode=args.mode, ingest_root=args.ingest_root)
+    server = PooledHTTPServer((args.host, args.port), kb, workers=args.workers, queue=args.queue)
+    # Handlers run on the serving thread, so the work goes to helper threads
+    def reload(*_):
+        threading.Thread(target=lambda: logger.info("Reloaded index: %s", kb.reload()), daemon=True).start()
+    def stop(*_):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Serving %s on http://%s:%d (%s)", args.index, *server.server_address[:2], kb.info())
+    try:
+        server.serve_forever()
+    finally:
+        logger.info("Shutting down, finishing %d request(s)", server.in_flight)
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,82 @@
 from dotenv import load_dotenv
 load_dotenv()
-import streamlit as st, json, time, tempfile
+import streamlit as st, json, time, tempfile, hashlib
 from pathlib import Path
 import shutil
 
 from ingest import ingest_files
-from retrieval import retrieve
-from generate import generate
+from retrieval import BM25Index, retrieve
+from generate import generate_stream
+from tracing import collect, summarize
+from profiling import profiled
 
-def save_uploaded_files(uploaded_files):
-    temp_dir = Path(tempfile.mkdtemp(prefix='rag_uploads_'))
+def save_uploaded_file(file, upload_dir):
+    file_path = Path(upload_dir) / file.name
+    with open(file_path, "wb") as f:
+        f.write(file.getbuffer())
+    return file_path
+
+def kb_fingerprint(docs):
+    h = hashlib.sha1()
+    for name in sorted(docs):
+        h.update(f"{name}\0{docs[name]['digest']}\0".encode("utf-8"))
+    return h.hexdigest()
+
+def update_kb(added=(), removed=(), new_docs=None):
+    # The only place the KB changes. A session index that is current is
+    # updated in place; otherwise it is rebuilt on the next query.
+    index = st.session_state.index if st.session_state.index_fingerprint == st.session_state.kb_fingerprint else None
+    removed = set(removed)
+    docs = {name: d for name, d in st.session_state.docs.items() if name not in removed}
+    for name, digest in (new_docs or {}).items():
+        docs[name] = {"digest": digest, "chunks": sum(c.get("source") == name for c in added)}
+    if removed:
+        st.session_state.chunks = [c for c in st.session_state.chunks if c.get("source") not in removed]
+    st.session_state.chunks += added
+    st.session_state.docs = docs
+    st.session_state.kb_fingerprint = kb_fingerprint(docs)
+    if index is not None:
+        for name in removed:
+            index.remove(name)
+        index.add(added)
+        st.session_state.index_fingerprint = st.session_state.kb_fingerprint
+    st.session_state.results = None
+
+def add_documents(uploaded_files):
+    # Files whose content is already in the KB are skipped; a changed file
+    # with a known name replaces the old version. Returns (added, skipped).
+    if st.session_state.uploaded_dir is None:
+        st.session_state.uploaded_dir = tempfile.mkdtemp(prefix='rag_uploads_')
+    known = {d["digest"] for d in st.session_state.docs.values()}
+    new_docs, paths = {}, []
     for file in uploaded_files:
-        file_path = temp_dir / file.name
-        with open(file_path, "wb") as f:
-            f.write(file.getbuffer())
-    return temp_dir
+        digest = hashlib.sha256(file.getbuffer()).hexdigest()
+        if digest in known or file.name in new_docs:
+            continue
+        known.add(digest)
+        new_docs[file.name] = digest
+        paths.append(save_uploaded_file(file, st.session_state.uploaded_dir))
+    if not paths:
+        return 0, len(uploaded_files)
+    chunks = ingest_files(paths)
+    # Files that gave no text (e.g. OCR errors) stay out of the KB so they can be retried
+    extracted = {c.get("source") for c in chunks}
+    new_docs = {name: digest for name, digest in new_docs.items() if name in extracted}
+    replaced = [name for name in new_docs if name in st.session_state.docs]
+    update_kb(added=chunks, removed=replaced, new_docs=new_docs)
+    return len(new_docs), len(uploaded_files) - len(paths)
+
+def remove_document(name):
+    if st.session_state.uploaded_dir:
+        (Path(st.session_state.uploaded_dir) / name).unlink(missing_ok=True)
+    update_kb(removed=[name])
+
+def session_index():
+    # Reused across reruns until the KB fingerprint changes
+    if st.session_state.index_fingerprint != st.session_state.kb_fingerprint:
+        st.session_state.index = BM25Index.build(st.session_state.chunks)
+        st.session_state.index_fingerprint = st.session_state.kb_fingerprint
+    return st.session_state.index
 
 st.set_page_config(page_title='RAG Test Case Generator', page_icon='🤖', layout='wide')
 st.markdown('<h1 style="text-align:center; background: #1e90ff; color:white; padding:0.4em 0;">RAG Test Case Generator</h1>', unsafe_allow_html=True)
@@ -23,6 +85,10 @@ st.markdown('<h1 style="text-align:center; background: #1e90ff; color:white; pad
 if "uploaded_dir" not in st.session_state:
     st.session_state.uploaded_dir = None
     st.session_state.chunks = []
+    st.session_state.docs = {}   # file name -> {"digest", "chunks"}
+    st.session_state.kb_fingerprint = kb_fingerprint({})
+    st.session_state.index = None
+    st.session_state.index_fingerprint = None
     st.session_state.results = None
 
 with st.sidebar:
@@ -33,24 +99,28 @@ with st.sidebar:
         accept_multiple_files=True)
     if uploaded_files:
         st.info(f"{len(uploaded_files)} file(s) selected.")
-        if st.button('Ingest Uploaded Files'):
-            if st.session_state.uploaded_dir:
-                shutil.rmtree(st.session_state.uploaded_dir, ignore_errors=True)
+        if st.button('Add to KB'):
             with st.spinner("Ingesting..."):
-                upload_dir = save_uploaded_files(uploaded_files)
-                st.session_state.uploaded_dir = str(upload_dir)
-                file_paths = list(upload_dir.glob("*"))
-                st.session_state.chunks = ingest_files(file_paths)
-                st.session_state.results = None
-                st.success(f"Ingested {len(file_paths)} files!")
+                added, skipped = add_documents(uploaded_files)
+                st.success(f"Added {added} file(s), {skipped} already in the KB.")
+                if added + skipped < len(uploaded_files):
+                    st.warning(f"No text extracted from {len(uploaded_files) - added - skipped} file(s).")
                 time.sleep(1)
                 st.rerun()
+    if st.session_state.docs:
+        st.subheader('Knowledge Base')
+        for name, doc in sorted(st.session_state.docs.items()):
+            col_name, col_rm = st.columns([4,1])
+            with col_name: st.caption(f"{name} ({doc['chunks']} chunks)")
+            with col_rm:
+                if st.button('✕', key=f"remove_{name}", help=f"Remove {name}"):
+                    remove_document(name)
+                    st.rerun()
     if st.button('Clear Session KB'):
         if st.session_state.uploaded_dir:
             shutil.rmtree(st.session_state.uploaded_dir, ignore_errors=True)
         st.session_state.uploaded_dir = None
-        st.session_state.chunks = []
-        st.session_state.results = None
+        update_kb(removed=list(st.session_state.docs))
         st.success("Session KB cleared. Ready for new uploads!")
     st.header('Settings')
     top_k = st.slider('Retrieved Chunks (top_k)', 3, 10, 5)
@@ -67,24 +137,44 @@ with col_btn2:
 
 if generate_btn and query.strip():
     st.markdown('<hr>', unsafe_allow_html=True)
-    with st.spinner('Retrieving...'):
-        try:
-            chunks = retrieve(query, st.session_state.chunks, top_k=top_k)
-            st.success(f"Retrieved {len(chunks)} relevant chunks.")
-            if show_debug:
-                with st.expander('Retrieved Evidence Chunks'):
-                    for i, c in enumerate(chunks,1):
-                        st.write(f"Chunk {i}: {c.get('source','?')} | Score: {c.get('score',0):.3f}")
-                        st.write(c.get('text','')[:300]+"..."); st.divider()
-        except Exception as e:
-            st.error(f'Retrieval error: {e}')
-            chunks = []
-    with st.spinner('Generating with AI...' if chunks else 'No relevant evidence, asking for clarifications...'):
-        try:
-            result = generate(query, chunks)
-            st.session_state.results = result
-            st.success(f"Generated using {result.get('model_used','?')} (status: {result.get('status','')})")
-        except Exception as e: st.error(f"Generation error: {e}")
+    # PROFILE_RATE samples whole Generate runs (retrieval + generation) into PROFILE_DIR
+    with profiled("generate") as profile:
+        with st.spinner('Retrieving...'):
+            try:
+                with collect() as retrieval_spans:
+                    chunks = retrieve(query, st.session_state.chunks, top_k=top_k, index=session_index())
+                st.success(f"Retrieved {len(chunks)} relevant chunks.")
+                if show_debug:
+                    with st.expander('Retrieved Evidence Chunks'):
+                        for i, c in enumerate(chunks,1):
+                            st.write(f"Chunk {i}: {c.get('source','?')} | Score: {c.get('score',0):.3f}")
+                            st.write(c.get('text','')[:300]+"..."); st.divider()
+            except Exception as e:
+                st.error(f'Retrieval error: {e}')
+                chunks, retrieval_spans = [], []
+        with st.spinner('Generating with AI...' if chunks else 'No relevant evidence, asking for clarifications...'):
+            try:
+                # Cases are shown as they stream in; the full result renders below once done
+                live = st.empty()
+                with live.container():
+                    for event, payload in generate_stream(query, chunks):
+                        if event == "case":
+                            st.json(payload)
+                        else:
+                            result = payload
+                live.empty()
+                # Index build (first query after a KB change) and retrieval come first
+                result["trace"] = retrieval_spans + result.get("trace", [])
+                st.session_state.results = result
+                st.success(f"Generated using {result.get('model_used','?')} (status: {result.get('status','')})")
+                if show_debug and result["trace"]:
+                    with st.expander('Latency Breakdown (ms)'):
+                        st.json(summarize(result["trace"]))
+                        st.dataframe([{"span": r["span"], "ms": r["duration_ms"], "outcome": r["outcome"],
+                                       **r.get("attrs", {})} for r in result["trace"]])
+            except Exception as e: st.error(f"Generation error: {e}")
+    if profile and show_debug:
+        st.caption(f"Profile: {profile['pstats']} · allocations: {profile['alloc']}")
 
 if st.session_state.results:
     result = st.session_state.results
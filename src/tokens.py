@@ -0,0 +1,47 @@
+import math, re
+
+# Llama-3's pre-tokenizer split (contractions, letter runs with one leading
+# non-letter, 1-3 digit groups, punctuation runs, newlines, spaces), with
+# \p{L}/\p{N} approximated by what Python's re supports.
+_PRETOKEN = re.compile(
+    r"'(?:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+",
+    re.IGNORECASE,
+)
+
+# Common English words are single tokens in the 128k vocabulary; longer or
+# non-ASCII pieces split into roughly one token per _BYTES_PER_TOKEN bytes.
+_SINGLE_TOKEN_MAX = 10
+_BYTES_PER_TOKEN = 6
+
+def count_tokens(text: str) -> int:
+    """Fast approximation of the llama-3 token count of `text`.
+
+    Errs slightly high on rare long words, which is the safe side for
+    budgeting prompts.
+    """
+    n = 0
+    for piece in _PRETOKEN.findall(text):
+        if len(piece) > 1 and piece[0] == " ":
+            piece = piece[1:]  # a leading space merges into the word's token
+        size = len(piece) if piece.isascii() else len(piece.encode("utf-8"))
+        n += 1 if size <= _SINGLE_TOKEN_MAX else math.ceil(size / _BYTES_PER_TOKEN)
+    return n
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n+')
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Longest prefix of whole sentences that fits in `budget` tokens ("" if none)."""
+    out, used, pos = [], 0, 0
+    for m in list(_SENTENCE_END.finditer(text)) + [None]:
+        end = m.start() if m else len(text)
+        sentence = text[pos:end]
+        cost = count_tokens(sentence)
+        if used + cost > budget:
+            break
+        out.append(sentence)
+        used += cost
+        if m is None:
+            break
+        out.append(m.group())
+        pos = m.end()
+    return "".join(out).rstrip()
@@ -0,0 +1,135 @@
+import contextvars, json, logging, math, os, threading, time
+from contextlib import contextmanager
+
+# Span records go to the "tracing" logger as JSON lines. TRACE_LOG=path
+# (or "-" for stderr) attaches a handler; otherwise they follow the root
+# logging config, which drops INFO by default.
+logger = logging.getLogger("tracing")
+if os.getenv("TRACE_LOG"):
+    _path = os.getenv("TRACE_LOG")
+    logger.addHandler(logging.StreamHandler() if _path == "-" else logging.FileHandler(_path, encoding="utf-8"))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+
+_collectors = contextvars.ContextVar("trace_collectors", default=())
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name, self.attrs = name, attrs
+        self.outcome = "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+class Tracer:
+    """Times pipeline stages and keeps per-stage latency histograms.
+
+    Every finished span is logged, added to the histograms and appended to
+    the lists of any enclosing collect() blocks.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}   # (name, outcome) -> [bucket counts, sum seconds, cpu seconds]
+
+    @contextmanager
+    def span(self, name, sink=None, **attrs):
+        # An exception marks the span "error" and propagates; code can also
+        # set span.outcome (e.g. "cache_hit", "empty") itself. `sink`, a list,
+        # also receives the record (for generators, where collect() would
+        # leak its context across yields).
+        span = Span(name, attrs)
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield span
+        except BaseException as e:
+            span.outcome = "error"
+            span.attrs.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            rec = self.record(name, (time.perf_counter() - start) * 1000, span.outcome,
+                              cpu_ms=(time.thread_time() - cpu) * 1000, **span.attrs)
+            if sink is not None:
+                sink.append(rec)
+
+    def record(self, name, duration_ms, outcome="ok", cpu_ms=None, **attrs):
+        rec = {"span": name, "duration_ms": round(duration_ms, 3), "outcome": outcome}
+        if cpu_ms is not None:
+            rec["cpu_ms"] = round(cpu_ms, 3)
+        if attrs:
+            rec["attrs"] = attrs
+        self._observe(rec, log=True)
+        return rec
+
+    def _observe(self, rec, log):
+        seconds, cpu_ms = rec["duration_ms"] / 1000, rec.get("cpu_ms")
+        name, outcome = rec["span"], rec["outcome"]
+        with self._lock:
+            counts, _, _ = entry = self._hist.setdefault((name, outcome), [[0] * len(BUCKETS), 0.0, 0.0])
+            counts[next(i for i, b in enumerate(BUCKETS) if seconds <= b)] += 1
+            entry[1] += seconds
+            entry[2] += (cpu_ms or 0) / 1000
+        for spans in _collectors.get():
+            spans.append(rec)
+        if log and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"ts": round(time.time(), 3), **rec}, ensure_ascii=False, default=str))
+
+    def replay(self, records):
+        # Spans recorded (and already logged) in another process, e.g. an ingest worker
+        for rec in records:
+            self._observe(rec, log=False)
+
+    def prometheus(self):
+        """Prometheus text exposition of the span histograms."""
+        lines = [
+            "# HELP rag_span_duration_seconds Time spent per pipeline stage.",
+            "# TYPE rag_span_duration_seconds histogram",
+        ]
+        cpu = ["# HELP rag_span_cpu_seconds_total CPU time spent per pipeline stage.",
+               "# TYPE rag_span_cpu_seconds_total counter"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._hist.items())
+        for (name, outcome), (counts, total, cpu_total) in items:
+            labels = f'span="{name}",outcome="{outcome}"'
+            running = 0
+            for bound, count in zip(BUCKETS, counts):
+                running += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f'rag_span_duration_seconds_bucket{{{labels},le="{le}"}} {running}')
+            lines.append(f"rag_span_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"rag_span_duration_seconds_count{{{labels}}} {running}")
+            cpu.append(f"rag_span_cpu_seconds_total{{{labels}}} {cpu_total:.6f}")
+        return "\n".join(lines + cpu) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+
+tracer = Tracer()
+
+@contextmanager
+def collect():
+    """Collects the records of spans finished inside the block, in order."""
+    spans = []
+    token = _collectors.set(_collectors.get() + (spans,))
+    try:
+        yield spans
+    finally:
+        _collectors.reset(token)
+
+def summarize(spans):
+    # Total milliseconds per span name, for a quick per-request breakdown
+    out = {}
+    for rec in spans:
+        out[rec["span"]] = round(out.get(rec["span"], 0) + rec["duration_ms"], 3)
+    return out
+
+def write_prometheus_snapshot(path=None):
+    # PROMETHEUS_SNAPSHOT=path makes batch runs leave a scrape-able snapshot behind
+    path = path or os.getenv("PROMETHEUS_SNAPSHOT")
+    if path:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(tracer.prometheus())
+        os.replace(tmp, path)
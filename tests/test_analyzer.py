@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import re
+from nltk.stem import PorterStemmer
+from analyzer import Analyzer
+
+
+def test_tokens_match_legacy_normalization():
+    text = "Users' filters: Running, runs & ran -- FILTERED results!"
+    ps = PorterStemmer()
+    legacy = ' '.join(ps.stem(w) for w in re.sub(r'[^\w\s]', '', text).lower().split())
+    assert Analyzer().tokens(text) == legacy.split()
+
+
+def test_stems_are_memoized_per_term():
+    analyzer = Analyzer(stem_cache_size=16)
+    analyzer.tokens("filter filters filter")
+    analyzer.tokens("filter")
+    info = analyzer.cache_info()
+    assert info.misses == 2
+    assert info.hits == 2
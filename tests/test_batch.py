@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import asyncio, io, json, threading, time
+import batch
+from rate_limit import RateLimiter, TokenBucket
+
+CHUNKS = [
+    {"text": "Users can filter flights by airline and price range.", "source": "flights.md", "chunk_id": 0},
+    {"text": "Export dashboards as PDF or CSV files.", "source": "dashboard.md", "chunk_id": 0},
+    {"text": "Hotel search supports twin beds and double bed filters.", "source": "hotels.md", "chunk_id": 0},
+]
+
+
+def test_run_batch_streams_in_completion_order_with_bounded_concurrency(monkeypatch):
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def fake_generate(query, evidence, cache=None, limiter=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05 if "flights" in query else 0.01)
+        with lock:
+            active[0] -= 1
+        return {"status": "success", "output_json": [{"Use Case Title": query}]}
+
+    async def fake_agenerate(query, evidence, cache=None, limiter=None):
+        return await asyncio.to_thread(fake_generate, query, evidence, cache, limiter)
+
+    monkeypatch.setattr(batch, "agenerate", fake_agenerate)
+    queries = ["filter flights", "export dashboards", "twin beds", "price range", "csv export"]
+    out = io.StringIO()
+    summary = asyncio.run(batch.run_batch(queries, CHUNKS, concurrency=2, out=out))
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert summary == {"queries": 5, "statuses": {"success": 5}}
+    assert sorted(r["id"] for r in records) == list(range(5))
+    assert records[-1]["query"] == "filter flights"
+    assert peak[0] <= 2
+
+
+def test_token_bucket_waits_once_capacity_is_spent():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert 0.9 < bucket.reserve() <= 1.0
+
+
+def test_rate_limiter_honours_the_tighter_limit():
+    sleeps = []
+    limiter = RateLimiter(rpm=600, tpm=600, sleep=sleeps.append)
+    limiter.acquire(tokens=600)
+    limiter.acquire(tokens=300)
+    assert sleeps and 29 < sleeps[-1] <= 30
@@ -0,0 +1,76 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import pytest
+from retrieval import BM25Index, retrieve, retrieve_many, _tokenize
+
+CHUNKS = [
+    {"text": "Users can filter flights by airline and price range.", "source": "flights.md", "chunk_id": 0},
+    {"text": "The dashboard shows charts with real-time data updates.", "source": "dashboard.md", "chunk_id": 0},
+    {"text": "Export dashboards as PDF or CSV files.", "source": "dashboard.md", "chunk_id": 1},
+    {"text": "Hotel search supports twin beds and double bed filters.", "source": "hotels.md", "chunk_id": 0},
+]
+
+
+def test_scores_match_rank_bm25():
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    reference = rank_bm25.BM25Okapi([_tokenize(c["text"]) for c in CHUNKS])
+    index = BM25Index.build(CHUNKS)
+    for query in ["dashboard export", "flight filter price", "unknown words"]:
+        tokens = _tokenize(query)
+        assert list(index.get_scores(tokens)) == pytest.approx(list(reference.get_scores(tokens)))
+
+
+def test_remove_and_add_in_place():
+    index = BM25Index.build(CHUNKS)
+    assert index.remove("dashboard.md") == 2
+    assert index.sources == ["flights.md", "hotels.md"]
+    assert retrieve("dashboard charts", [], index=index) == []
+    index.add(CHUNKS[1:3])
+    assert retrieve("dashboard charts", [], index=index)[0]["source"] == "dashboard.md"
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    index = BM25Index.build(CHUNKS)
+    path = tmp_path / "index.bm25.json"
+    index.save(path)
+    loaded = BM25Index.load(path, CHUNKS)
+    tokens = _tokenize("twin beds hotel")
+    assert list(loaded.get_scores(tokens)) == pytest.approx(list(index.get_scores(tokens)))
+    with pytest.raises(ValueError):
+        BM25Index.load(path, CHUNKS[:2])
+
+
+def _legacy_retrieve(query, chunks, top_k):
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    bm25 = rank_bm25.BM25Okapi([_tokenize(c["text"]) for c in chunks])
+    scores = bm25.get_scores(_tokenize(query))
+    lo, hi = float(min(scores)), float(max(scores))
+    norm = [(s - lo) / (hi - lo) if hi > lo else 0 for s in scores]
+    order = sorted(range(len(norm)), key=lambda i: norm[i], reverse=True)[:top_k]
+    return [(chunks[i]["source"], chunks[i]["chunk_id"]) for i in order if norm[i] > 0.1]
+
+
+def test_retrieve_many_matches_single_and_legacy():
+    queries = ["dashboard export csv", "twin beds", "filter flights by price", "nothing matches here"]
+    batched = retrieve_many(queries, CHUNKS, top_k=2, batch_size=3)
+    for query, hits in zip(queries, batched):
+        assert hits == retrieve(query, CHUNKS, top_k=2)
+        assert [(h["source"], h["chunk_id"]) for h in hits] == _legacy_retrieve(query, CHUNKS, 2)
+
+
+def test_top_k_breaks_ties_by_slot_like_a_stable_sort(monkeypatch):
+    import numpy as np
+    import retrieval
+    rng = np.random.default_rng(3)
+    norm = rng.integers(0, 5, size=(500, 40)) / 4.0   # lots of ties
+    for k in (1, 3, 10, 40):
+        expected = [[(int(i), float(row[i])) for i in np.argsort(-row, kind="stable")[:k] if row[i] > 0.1]
+                    for row in norm]
+        assert retrieval._top_k(norm.copy(), k) == expected
+    # A tiny score budget forces one query per batch without changing results
+    queries = ["dashboard export", "filters", "hotel twin beds"]
+    expected = retrieve_many(queries, CHUNKS, top_k=2)
+    monkeypatch.setattr(retrieval, "SCORE_BUDGET", 1)
+    assert retrieve_many(queries, CHUNKS, top_k=2) == expected
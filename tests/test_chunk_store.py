@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import json
+from chunk_store import ChunkStore
+from retrieval import BM25Index, index_path_for, load_index, retrieve
+
+CHUNKS = [
+    {"text": "Users can filter flights by airline and price range.", "source": "flights.md",
+     "chunk_id": 0, "char_count": 52, "word_count": 9},
+    {"text": "Le tableau de bord affiche des graphiques en temps réel.", "source": "dashboard.md",
+     "chunk_id": 0, "char_count": 56, "word_count": 10},
+    {"text": "Export dashboards as PDF or CSV files.", "source": "dashboard.md",
+     "chunk_id": 1, "char_count": 38, "word_count": 7, "page": 3},
+]
+
+
+def test_roundtrip_and_json_export(tmp_path):
+    path = tmp_path / "index.bin"
+    ChunkStore.write(path, CHUNKS)
+    store = ChunkStore(path)
+    assert len(store) == 3
+    assert store.sources == ["flights.md", "dashboard.md"]
+    assert store.keys() == [("flights.md", 0), ("dashboard.md", 0), ("dashboard.md", 1)]
+    assert store[1] == CHUNKS[1] and store[-1] == CHUNKS[2]
+    store.export_json(tmp_path / "index.json")
+    assert json.loads((tmp_path / "index.json").read_text(encoding="utf-8")) == CHUNKS
+
+
+def test_load_index_decodes_only_returned_chunks(tmp_path):
+    path = tmp_path / "index.bin"
+    ChunkStore.write(path, CHUNKS)
+    BM25Index.build(CHUNKS).save(index_path_for(path))
+    store, index = load_index(path)
+    assert isinstance(store, ChunkStore)
+    assert all(isinstance(c, int) for c in index.chunks)
+    hits = retrieve("export csv", store, index=index)
+    assert hits == retrieve("export csv", CHUNKS)
+    assert sum(isinstance(c, dict) for c in index.chunks) == len(hits)
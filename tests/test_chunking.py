@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import random, re
+from chunking import chunk_text_smart, iter_chunks
+
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "sample"
+
+
+def _check_offsets_and_coverage(text, chunks):
+    for c in chunks:
+        assert c["text"] and text[c["start"]:c["end"]] == c["text"]
+    words = {m.span() for m in re.finditer(r"\S+", text)}
+    covered = {w for w in words for c in chunks if c["start"] <= w[0] and w[1] <= c["end"]}
+    assert covered == words
+
+
+def test_stream_matches_whole_text_on_sample_docs():
+    for path in SAMPLE.glob("*.md"):
+        text = path.read_text(encoding="utf-8")
+        whole = list(iter_chunks([text], max_words=40, min_words=5, overlap=8))
+        assert list(iter_chunks(text.split("\n"), max_words=40, min_words=5, overlap=8)) == whole
+        _check_offsets_and_coverage(text, whole)
+
+
+def test_stream_matches_whole_text_on_random_pieces():
+    rng = random.Random(7)
+    tokens = ["a", "bb", "x.", "y..", "\n", "\n\n", "..", "\r\n\r\n", ".", " ", "word", "\r", "end!"]
+    for _ in range(2000):
+        max_words, min_words = rng.choice([1, 3, 8]), rng.choice([0, 2, 4])
+        overlap = rng.randrange(max_words)
+        text = "".join(rng.choice(tokens) + rng.choice([" ", ""]) for _ in range(rng.randint(0, 50)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 5))))
+        pieces = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        whole = list(iter_chunks([text], max_words, min_words, overlap))
+        assert list(iter_chunks(pieces, max_words, min_words, overlap, joiner="")) == whole
+        _check_offsets_and_coverage(text, whole)
+        assert all(len(c["text"].split()) <= max_words + min_words for c in whole)
+
+
+def test_short_paragraphs_are_merged_not_dropped():
+    text = "Title\n\nFirst short paragraph.\n\nSecond one here.\n\nThird."
+    assert chunk_text_smart(text, max_words=180, min_words=32) == [text]
+    assert chunk_text_smart(text, max_words=5, min_words=2) == [
+        "Title\n\nFirst short paragraph.", "Second one here.\n\nThird."]
+
+
+def test_overlap_repeats_whole_sentences():
+    text = " ".join(f"Sentence {i} is here." for i in range(6))
+    chunks = chunk_text_smart(text, max_words=8, min_words=2, overlap=4)
+    assert chunks == ["Sentence 0 is here. Sentence 1 is here.",
+                      "Sentence 1 is here. Sentence 2 is here.",
+                      "Sentence 2 is here. Sentence 3 is here.",
+                      "Sentence 3 is here. Sentence 4 is here.",
+                      "Sentence 4 is here. Sentence 5 is here."]
+
+
+def test_long_run_is_flushed_before_stream_ends():
+    def pages():
+        for i in range(1000):
+            yield f"word{i} " * 10
+    stream = iter_chunks(pages(), max_words=50, min_words=10, joiner="")
+    first = next(stream)
+    assert first["text"].split()[0] == "word0" and len(first["text"].split()) == 50
+    assert first["start"] == 0 and len(list(stream)) == 199
+
+
+def test_run_without_boundaries_split_mid_word():
+    text = " ".join(f"token{i}" for i in range(3000))
+    whole = list(iter_chunks([text], max_words=50, min_words=10, overlap=5))
+    pieces = [text[i:i + 7] for i in range(0, len(text), 7)]
+    assert list(iter_chunks(pieces, max_words=50, min_words=10, overlap=5, joiner="")) == whole
+    assert [len(c["text"].split()) for c in whole] == [50] * 60
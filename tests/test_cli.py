@@ -0,0 +1,121 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import json, shutil
+import pytest
+import batch, cli
+from chunk_store import load_chunks
+
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "sample"
+
+
+@pytest.fixture(autouse=True)
+def _tmp_extract_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXTRACT_CACHE_DIR", str(tmp_path / "cache"))
+
+
+def _ingest(capsys, index, *paths, options=()):
+    assert cli.main(["--index", str(index), "ingest", *map(str, paths), "--workers", "1", *options]) == 0
+    return capsys.readouterr().out
+
+
+def test_ingest_is_incremental_and_query_reads_the_index(tmp_path, capsys):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for path in SAMPLE.glob("*.md"):
+        shutil.copy(path, docs)
+    index = tmp_path / "index.bin"
+    assert "2 new or changed, 0 removed" in _ingest(capsys, index, docs)
+    assert "0 new or changed, 0 removed" in _ingest(capsys, index, docs)
+
+    (docs / "Dashboard Feature.md").unlink()
+    (docs / "hotels.txt").write_text("Hotel search supports twin beds and double bed filters.", encoding="utf-8")
+    assert "1 new or changed, 0 removed" in _ingest(capsys, index, docs)
+    assert "0 new or changed, 1 removed" in _ingest(capsys, index, docs, options=["--prune"])
+
+    assert cli.main(["--index", str(index), "query", "twin beds", "dashboard", "--json", "--top-k", "2"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["query"] for r in lines] == ["twin beds", "dashboard"]
+    assert lines[0]["results"][0]["source"] == "hotels.txt"
+    assert all(r["source"] != "Dashboard Feature.md" for r in lines[1]["results"])
+
+
+def test_ingesting_one_file_keeps_the_rest(tmp_path, capsys):
+    index = tmp_path / "index.bin"
+    _ingest(capsys, index, SAMPLE)
+    sources = lambda: {c["source"] for c in load_chunks(index)}
+    before = sources()
+    extra = tmp_path / "notes.md"
+    extra.write_text("Flight search can be filtered by airline and stops.", encoding="utf-8")
+    assert "1 new or changed, 0 removed" in _ingest(capsys, index, extra)
+    assert sources() == before | {"notes.md"} and len(before) > 1
+
+
+def test_extractor_bump_or_lost_manifest_keeps_other_documents(tmp_path, capsys, monkeypatch):
+    import ingest
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for path in SAMPLE.glob("*.md"):
+        shutil.copy(path, docs)
+    index = tmp_path / "index.bin"
+    _ingest(capsys, index, docs)
+    sources = lambda: {c["source"] for c in load_chunks(index)}
+    before = sources()
+    extra = tmp_path / "notes.md"
+    extra.write_text("Flight search can be filtered by airline and stops.", encoding="utf-8")
+
+    # Older extractor: the other documents are re-extracted from their recorded paths
+    monkeypatch.setattr(ingest, "EXTRACTOR_VERSION", "old")
+    _ingest(capsys, index, extra)
+    monkeypatch.undo()
+    assert "3 new or changed, 0 removed" in _ingest(capsys, index, extra)
+    assert sources() == before | {"notes.md"}
+
+    # A document whose file is gone cannot be redone and is reported as removed
+    (docs / "Dashboard Feature.md").unlink()
+    monkeypatch.setattr(ingest, "EXTRACTOR_VERSION", "newer")
+    assert "2 new or changed, 1 removed" in _ingest(capsys, index, extra)
+    assert sources() == before - {"Dashboard Feature.md"} | {"notes.md"}
+
+    # Lost manifest: chunks are kept as they are
+    (tmp_path / "index.docs.json").unlink()
+    assert "1 new or changed, 0 removed" in _ingest(capsys, index, extra)
+    assert sources() == before - {"Dashboard Feature.md"} | {"notes.md"}
+
+
+def test_batch_streams_jsonl_records(tmp_path, capsys, monkeypatch):
+    async def fake_agenerate(query, evidence, cache=None, limiter=None):
+        return {"status": "success", "output_json": [{"Use Case Title": query}]}
+
+    monkeypatch.setattr(batch, "agenerate", fake_agenerate)
+    index = tmp_path / "index.bin"
+    _ingest(capsys, index, *SAMPLE.glob("*.md"))
+    queries = tmp_path / "queries.jsonl"
+    queries.write_text('{"query": "flight filters", "id": "q1", "tag": "x"}\n\ndashboard roles\n'
+                       'create dashboard\n', encoding="utf-8")
+    out = tmp_path / "out.jsonl"
+    assert cli.main(["--index", str(index), "batch", str(queries), "--out", str(out), "--window", "2"]) == 0
+    records = sorted((json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()), key=lambda r: str(r["id"]))
+    assert [(r["id"], r["query"]) for r in records] == [(1, "dashboard roles"), (2, "create dashboard"), ("q1", "flight filters")]
+    assert records[2]["tag"] == "x" and records[2]["retrieved"] > 0
+    assert all(r["result"]["status"] == "success" for r in records)
+
+
+def test_batch_retrieves_with_the_chosen_mode(tmp_path, capsys, monkeypatch):
+    async def fake_agenerate(query, evidence, cache=None, limiter=None):
+        return {"status": "success", "output_json": []}
+
+    monkeypatch.setattr(batch, "agenerate", fake_agenerate)
+    monkeypatch.setenv("EMBEDDER", "hashing-64")
+    index = tmp_path / "index.bin"
+    _ingest(capsys, index, *SAMPLE.glob("*.md"))
+    calls = []
+    real = batch.retrieve_many
+    monkeypatch.setattr(batch, "retrieve_many", lambda *a, **kw: calls.append(kw) or real(*a, **kw))
+    queries = tmp_path / "queries.jsonl"
+    queries.write_text("flight filters\n", encoding="utf-8")
+    out = tmp_path / "out.jsonl"
+    assert cli.main(["--index", str(index), "batch", str(queries), "--out", str(out), "--mode", "hybrid"]) == 0
+    assert calls[0]["mode"] == "hybrid" and calls[0]["dense_index"] is not None
+    assert json.loads(out.read_text(encoding="utf-8"))["retrieved"] > 0
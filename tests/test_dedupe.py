@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from chunk_store import ChunkStore
+from guardrails import DEDUPE_THRESHOLD, dedupe_chunks
+from ingest import ingest_files
+from minhash import band_pairs, containment, default_minhasher, lsh_params, similarity
+from retrieval import retrieve
+
+SPEC = ("The dashboard feature allows users to create, edit, delete and duplicate dashboards. "
+        "Admins can set who can share dashboards and which data sources each role may access.")
+# The same paragraph as exported to Markdown and through OCR
+SPEC_MD = SPEC.replace("The dashboard feature", "**The dashboard feature**")
+SPEC_OCR = SPEC.replace("duplicate", "dup1icate").replace(",", "")
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "sample"
+OTHER = "Hotel search results can be filtered by price, star rating, twin beds and free cancellation."
+
+
+def chunk(text, source, chunk_id=0):
+    return {"text": text, "source": source, "chunk_id": chunk_id,
+            "minhash": default_minhasher.signature(text).tolist()}
+
+
+def test_signatures_estimate_similarity():
+    sig = default_minhasher.signature
+    assert similarity(sig(SPEC), sig(SPEC_MD)) == 1.0
+    assert similarity(sig(SPEC), sig(SPEC_OCR)) >= 0.8
+    assert similarity(sig(SPEC), sig(OTHER)) < 0.2
+    assert sig("").shape == (default_minhasher.num_perm,)
+
+
+def test_lsh_params_sit_below_threshold():
+    for threshold in (0.5, 0.8, 0.9):
+        bands, rows = lsh_params(64, threshold)
+        assert bands * rows == 64
+        assert (1 / bands) ** (1 / rows) <= threshold
+
+
+def test_band_pairs_finds_signatures_sharing_a_band():
+    sigs = [default_minhasher.signature(t) for t in (SPEC, OTHER, SPEC_OCR, SPEC_MD)]
+    later, earlier = band_pairs(sigs, *lsh_params(64, 0.8))
+    assert sorted(zip(later.tolist(), earlier.tolist())) == [(2, 0), (3, 0), (3, 2)]
+
+
+def test_dedupe_keeps_first_of_each_group():
+    chunks = [chunk(SPEC, "spec.docx"), chunk(OTHER, "hotels.pdf"),
+              chunk(SPEC_MD, "spec.md"), {"text": SPEC_OCR, "source": "spec.png", "chunk_id": 0}]
+    assert [c["source"] for c in dedupe_chunks(chunks)] == ["spec.docx", "hotels.pdf"]
+    assert len(dedupe_chunks(chunks, threshold=1.01)) == 4
+
+
+def test_retrieve_backfills_dropped_duplicates(tmp_path):
+    chunks = [chunk(SPEC, "spec.docx"), chunk(SPEC_MD, "spec.md"), chunk(SPEC_OCR, "spec.png"),
+              chunk("Users can duplicate a dashboard from its menu.", "faq.md")]
+    chunks += [chunk(f"{OTHER} Page {i}.", "hotels.pdf", i) for i in range(6)]
+    ChunkStore.write(tmp_path / "index.bin", chunks)
+    store = ChunkStore(tmp_path / "index.bin")
+    assert store[2]["minhash"] == chunks[2]["minhash"]
+    hits = retrieve("dashboards roles", store, top_k=2)
+    assert [h["source"] for h in hits] == ["spec.docx", "faq.md"]
+    assert "minhash" not in hits[0]
+    assert len(retrieve("dashboards roles", store, top_k=2, dedupe=False)) == 2
+
+
+def test_containment_survives_shifted_chunk_boundaries():
+    sh = default_minhasher.shingles
+    longer = "Overview of the feature. " + SPEC + " Dashboards refresh every five minutes."
+    # Whole-chunk Jaccard misses it at the old 0.8 cutoff
+    assert similarity(default_minhasher.signature(SPEC), default_minhasher.signature(longer)) < 0.8
+    assert containment(sh(SPEC), sh(longer)) == containment(sh(longer), sh(SPEC)) == 1.0
+    assert containment(sh(SPEC), sh(OTHER)) < 0.3 and containment(sh("Dashboards"), sh(SPEC)) == 1.0
+    # Short chunks need to be mostly covered by min_size shingles, not just contained
+    assert containment(sh("Dashboards"), sh(SPEC), min_size=100) < 0.1
+    assert [c["source"] for c in dedupe_chunks([chunk(longer, "spec.pdf"), chunk(SPEC, "spec.md")])] == ["spec.pdf"]
+
+
+def test_sample_documents_in_several_formats_are_deduped():
+    files = [p for p in SAMPLE.glob("*") if p.suffix in (".md", ".txt", ".docx", ".pdf")]
+    chunks = ingest_files(sorted(files), workers=1, cache=False)
+    assert all(len(c["minhash"]) == default_minhasher.num_perm for c in chunks)
+    for query in ("flight filters airline", "dashboard create edit", "hotel search twin beds"):
+        hits = retrieve(query, chunks, top_k=5)
+        sh = [default_minhasher.shingles(h["text"]) for h in hits]
+        assert all(containment(sh[i], sh[j], 100) < DEDUPE_THRESHOLD for i in range(len(sh)) for j in range(i))
+        # Same document and chunk number in another format: a copy
+        same_passage = lambda hs: len({(h["source"].rsplit(".", 1)[0], h["chunk_id"]) for h in hs}) < len(hs)
+        assert same_passage(retrieve(query, chunks, top_k=5, dedupe=False)) and not same_passage(hits)
+    top = retrieve("flight filters airline", chunks, top_k=5)
+    assert sum(h["source"].startswith("Booking.com Filters Flight") and h["chunk_id"] == 0 for h in top) == 1
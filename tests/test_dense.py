@@ -0,0 +1,83 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np
+import pytest
+from dense import HashingEmbedder, DenseIndex
+from retrieval import retrieve
+
+pytest.importorskip("faiss")
+
+CHUNKS = [
+    {"text": "Users can filter flights by airline and price range.", "source": "flights.md", "chunk_id": 0},
+    {"text": "The dashboard shows charts with real-time data updates.", "source": "dashboard.md", "chunk_id": 0},
+    {"text": "Export dashboards as PDF or CSV files.", "source": "dashboard.md", "chunk_id": 1},
+    {"text": "Hotel search supports twin beds and double bed filters.", "source": "hotels.md", "chunk_id": 0},
+]
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    a, b = HashingEmbedder(64).embed(["price range filter"]), HashingEmbedder(64).embed(["price range filter"])
+    assert np.array_equal(a, b)
+    assert np.isclose(np.linalg.norm(a), 1.0)
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf"])
+def test_dense_retrieve_save_load_and_remove(tmp_path, kind):
+    embedder = HashingEmbedder(128)
+    index = DenseIndex.build(CHUNKS, embedder, batch_size=2, kind=kind, nlist=2, nprobe=2)
+    hits = retrieve("twin beds hotel", CHUNKS, mode="dense", dense_index=index)
+    assert hits[0]["source"] == "hotels.md" and 0 < hits[0]["score"] <= 1
+
+    path = tmp_path / "index.faiss"
+    index.save(path)
+    loaded = DenseIndex.load(path, CHUNKS, embedder)
+    assert retrieve("twin beds hotel", CHUNKS, mode="dense", dense_index=loaded) == hits
+
+    assert loaded.remove("hotels.md") == 1
+    hits = retrieve("twin beds hotel", CHUNKS, mode="dense", dense_index=loaded)
+    assert all(h["source"] != "hotels.md" for h in hits)
+    with pytest.raises(ValueError):
+        DenseIndex.load(path, CHUNKS, HashingEmbedder(64))
+    # A chunk added without the dense index (plain ingest) makes it stale
+    extra = {"text": "Sort flights by departure time.", "source": "b.md", "chunk_id": 0}
+    with pytest.raises(ValueError, match="stale"):
+        DenseIndex.load(path, CHUNKS + [extra], embedder)
+
+
+def test_ingest_without_embedder_drops_the_dense_index(tmp_path, monkeypatch):
+    from dense import dense_path_for, load_dense_index
+    from ingest import update_index
+    from chunk_store import load_chunks
+    monkeypatch.setenv("EXTRACT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("EMBEDDER", "hashing-64")
+    (tmp_path / "a.md").write_text(CHUNKS[0]["text"], encoding="utf-8")
+    (tmp_path / "b.md").write_text(CHUNKS[3]["text"], encoding="utf-8")
+    chunks_path = tmp_path / "index.bin"
+    update_index([tmp_path / "a.md"], chunks_path)
+    assert dense_path_for(chunks_path).exists()
+    monkeypatch.delenv("EMBEDDER")
+    update_index([tmp_path / "b.md"], chunks_path)
+    assert not dense_path_for(chunks_path).exists()
+    chunks = load_chunks(chunks_path)
+    dense = load_dense_index(chunks_path, chunks, HashingEmbedder(64))
+    assert retrieve("twin beds hotel", chunks, mode="dense", dense_index=dense)[0]["source"] == "b.md"
+
+
+def test_hybrid_fuses_ranks_and_keeps_result_shape():
+    index = DenseIndex.build(CHUNKS, HashingEmbedder(128))
+    hits = retrieve("export dashboard charts", CHUNKS, top_k=3, mode="hybrid", dense_index=index)
+    assert hits and hits[0]["source"] == "dashboard.md"
+    assert all({"score", "source", "chunk_id", "text"} <= set(h) for h in hits)
+    assert all(0 < h["score"] <= 1 for h in hits)
+    assert [h["score"] for h in hits] == sorted((h["score"] for h in hits), reverse=True)
+
+    lexical_only = retrieve("export dashboard charts", CHUNKS, top_k=3, mode="hybrid", dense_index=index,
+                            hybrid={"dense_weight": 0.0, "bm25_candidates": 1})
+    assert len(lexical_only) == 1
+    assert lexical_only[0]["bm25_rank"] == 1 and lexical_only[0]["score"] == 1.0
+    assert "dense_rank" not in lexical_only[0]
+    for bad in ({"dense_weight": -1}, {"bm25_weight": 0, "dense_weight": 0}):
+        with pytest.raises(ValueError):
+            retrieve("export dashboard charts", CHUNKS, mode="hybrid", dense_index=index, hybrid=bad)
@@ -0,0 +1,149 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import json
+from types import SimpleNamespace
+import pytest
+import generate
+
+EVIDENCE = [{"text": "Users can filter flights by airline.", "source": "flights.md", "chunk_id": 0, "score": 0.9}]
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeCompletions:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=outcome))])
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    def install(*outcomes):
+        completions = FakeCompletions(outcomes)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        monkeypatch.setattr(generate, "USE_GROQ", True)
+        monkeypatch.setattr(generate, "_get_client", lambda: client)
+        monkeypatch.setattr(generate.time, "sleep", lambda s: None)
+        monkeypatch.setenv("LLM_CACHE_PATH", "")
+        return completions
+    return install
+
+
+def test_retries_429_and_5xx_then_succeeds(fake_llm, monkeypatch):
+    monkeypatch.setattr(generate, "GROQ_MAX_RETRIES", 3)
+    completions = fake_llm(StatusError(429), StatusError(503), json.dumps([{"Use Case Title": "Filter"}]))
+    result = generate.generate("filters", EVIDENCE)
+    assert result["status"] == "success"
+    assert result["llm"]["retries"] == 2
+    assert len(result["llm"]["attempt_latencies_ms"]) == 3
+    assert len(completions.calls) == 3
+
+
+def test_client_errors_are_not_retried(fake_llm):
+    completions = fake_llm(StatusError(400))
+    result = generate.generate("filters", EVIDENCE)
+    assert result["status"] == "error"
+    assert result["llm"]["retries"] == 0
+    assert len(completions.calls) == 1
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    delays = []
+    monkeypatch.setattr(generate, "GROQ_BACKOFF_BASE", 1.0)
+    monkeypatch.setattr(generate, "GROQ_BACKOFF_MAX", 2.0)
+    calls = iter([StatusError(500)] * 4)
+
+    def call():
+        raise next(calls)
+    with pytest.raises(StatusError) as err:
+        generate._call_with_retries(call, max_retries=3, sleep=delays.append)
+    assert err.value.llm_stats["retries"] == 3
+    assert len(delays) == 3 and all(0 <= d <= 2.0 for d in delays)
+
+
+def test_rate_limit_wait_is_not_llm_latency(fake_llm, monkeypatch):
+    class SlowLimiter:
+        def acquire(self, tokens):
+            # Spin, since the fixture stubs out time.sleep
+            end = generate.time.perf_counter() + 0.2
+            while generate.time.perf_counter() < end:
+                pass
+            return 0.2
+
+    monkeypatch.setattr(generate, "GROQ_MAX_RETRIES", 1)
+    fake_llm(StatusError(503), json.dumps([{"Use Case Title": "Filter"}]))
+    result = generate.generate("filters", EVIDENCE, limiter=SlowLimiter())
+    assert result["llm"]["rate_limit_wait_ms"] == 400.0
+    assert result["llm"]["latency_ms"] < 100
+    spans = {rec["span"]: rec for rec in result["trace"]}
+    assert spans["llm_call"]["attrs"]["rate_limit_wait_ms"] == 400.0
+
+
+def test_response_cache_replays_parsed_completions(fake_llm, tmp_path):
+    from llm_cache import LLMCache
+    cache = LLMCache(tmp_path / "llm.sqlite3")
+    completions = fake_llm("not json", json.dumps([{"Use Case Title": "Filter"}]))
+    assert generate.generate("filters", EVIDENCE, cache=cache)["status"] == "error"
+    assert len(cache) == 0
+    first = generate.generate("filters", EVIDENCE, cache=cache)
+    second = generate.generate("filters", EVIDENCE, cache=cache)
+    assert (first["cache_hit"], second["cache_hit"]) == (False, True)
+    assert second["output_json"] == first["output_json"]
+    assert second["llm"] is None
+    assert len(completions.calls) == 2
+
+
+def test_response_cache_ttl_and_size_cap(tmp_path):
+    from llm_cache import LLMCache
+    cache = LLMCache(tmp_path / "llm.sqlite3", ttl=60, max_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, key.upper())
+    assert len(cache) == 2 and cache.get("a") is None
+    cache.ttl = -1
+    assert cache.get("c") is None
+
+
+def test_generate_stream_yields_cases_before_result(monkeypatch):
+    cases = [{"Use Case Title": "A"}, {"Use Case Title": "B"}]
+    text = json.dumps(cases)
+    deltas = [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def create(**kwargs):
+        assert kwargs["stream"] is True
+        return iter(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=d))]) for d in deltas)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(generate, "USE_GROQ", True)
+    monkeypatch.setattr(generate, "_get_client", lambda: client)
+    events = list(generate.generate_stream("filters", EVIDENCE, cache=False))
+    assert events[:2] == [("case", cases[0]), ("case", cases[1])]
+    event, result = events[-1]
+    assert event == "result" and result["status"] == "success" and result["output_json"] == cases
+    assert "first_case_ms" in result["llm"] and "stream_ms" in result["llm"]
+
+
+def test_result_carries_stage_trace(fake_llm, monkeypatch):
+    monkeypatch.setattr(generate, "GROQ_MAX_RETRIES", 1)
+    fake_llm(StatusError(503), "Sure: " + json.dumps([{"Use Case Title": "Filter"}]))
+    result = generate.generate("filters", EVIDENCE)
+    spans = {rec["span"]: rec for rec in result["trace"]}
+    assert list(spans) == ["prompt_build", "llm_cache", "llm_call", "json_parse"]
+    assert spans["llm_call"]["attrs"]["retries"] == 1
+    assert spans["json_parse"]["attrs"]["objects"] == 1
+    assert result["prompt_packing"]["prompt_tokens"] == spans["prompt_build"]["attrs"]["prompt_tokens"]
+
+    fake_llm(StatusError(400))
+    failed = generate.generate("filters", EVIDENCE)
+    assert failed["trace"][-1]["span"] == "llm_call" and failed["trace"][-1]["outcome"] == "error"
@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from ingest import ingest_files
+
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "sample"
+
+
+def test_parallel_ingest_matches_serial():
+    files = sorted(SAMPLE.glob("*.md")) + sorted(SAMPLE.glob("*.txt"))
+    serial = ingest_files(files, workers=1, cache=False)
+    assert serial
+    assert ingest_files(files, workers=3, cache=False) == serial
+
+
+def test_extraction_cache_skips_reparsing(tmp_path, monkeypatch):
+    import ingest
+    from extract_cache import ExtractionCache
+    cache = ExtractionCache(tmp_path / "cache")
+    doc = tmp_path / "spec.md"
+    doc.write_text(" ".join(["the flight filter keeps the selected airlines"] * 10), encoding="utf-8")
+    first = ingest_files([doc], cache=cache)
+    assert first
+    entry = cache.get(cache.key(doc))
+    assert entry["text"] == doc.read_text(encoding="utf-8")
+    assert [c["text"] for c in entry["chunks"]] == [c["text"] for c in first]
+
+    calls = []
+    monkeypatch.setattr(ingest, "extract_text", lambda p: calls.append(p) or "")
+    renamed = tmp_path / "copy.md"
+    renamed.write_bytes(doc.read_bytes())
+    assert ingest_files([doc], cache=cache) == first
+    assert [c["source"] for c in ingest_files([renamed], cache=cache)] == ["copy.md"]
+    assert calls == []
+
+
+def test_extraction_cache_evicts_least_recently_used(tmp_path):
+    import os
+    from extract_cache import ExtractionCache
+    cache = ExtractionCache(tmp_path, max_bytes=250)
+    for i, key in enumerate(["aa1", "bb2", "cc3"]):
+        cache.put(key, {"text": "x" * 100, "chunks": []})
+        os.utime(cache._path(key), (i, i))
+    cache.get("aa1")
+    assert cache.evict() == 2
+    assert cache.get("aa1") is not None
+    assert cache.get("bb2") is None and cache.get("cc3") is None
+
+
+def test_update_index_hashes_each_file_once(tmp_path, monkeypatch):
+    import extract_cache
+    from ingest import update_index
+    monkeypatch.setenv("EXTRACT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("EMBEDDER", raising=False)
+    files = sorted(SAMPLE.glob("*.md"))
+    reads = []
+    real = extract_cache.file_digest
+    monkeypatch.setattr(extract_cache, "file_digest", lambda p: reads.append(p) or real(p))
+    summary = update_index(files, tmp_path / "index.bin", workers=1)
+    assert summary["changed"] == len(files)
+    assert reads == []   # the manifest digest doubles as the cache key
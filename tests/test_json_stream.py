@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import json, time
+from json_stream import JSONObjectStream, extract_json_objects
+
+CASES = [
+    {"Use Case Title": "Apply {airline} filter", "Steps": ["open [filters]", "say \"hi\\\""], "Test Data": {"a": [1, {"b": 2}]}},
+    {"Use Case Title": "Clear all", "Steps": [], "Negative cases": "none"},
+]
+
+
+def _feed_in_pieces(text, size):
+    parser, out = JSONObjectStream(), []
+    for i in range(0, len(text), size):
+        out += parser.feed(text[i:i + size])
+    return out
+
+
+def test_objects_emitted_for_any_split():
+    text = "Here are the cases: [\n" + ",\n".join(json.dumps(c) for c in CASES) + "\n] Done."
+    for size in (1, 2, 3, 7, len(text)):
+        assert _feed_in_pieces(text, size) == CASES
+
+
+def test_each_object_emitted_when_its_brace_closes():
+    parser = JSONObjectStream()
+    first = json.dumps(CASES[0])
+    assert parser.feed("[" + first[:-1]) == []
+    assert parser.feed(first[-1] + ", {\"x\":") == [CASES[0]]
+
+
+def test_bare_objects_and_truncated_tail():
+    text = json.dumps(CASES[0]) + "\n" + json.dumps(CASES[1]) + "\n[{\"Use Case Title\": \"cut"
+    assert _feed_in_pieces(text, 5) == CASES
+
+
+def test_extract_matches_stream_on_every_shape():
+    texts = [
+        "Here are the cases: [\n" + ",\n".join(json.dumps(c) for c in CASES) + "\n] Done.",
+        "```json\n" + json.dumps(CASES[0]) + "\n```\n" + json.dumps(CASES[1]),
+        json.dumps(CASES[0]) + " oops {\"bad\": } [{\"nested\": {\"x\": 1}}, " + json.dumps(CASES[1]) + "]",
+        "[" + json.dumps(CASES[0]) + ", {\"Use Case Title\": \"cut",
+    ]
+    for text in texts:
+        assert extract_json_objects(text) == JSONObjectStream().feed(text)
+    assert extract_json_objects(texts[2]) == [CASES[0], {"nested": {"x": 1}}, CASES[1]]
+    assert extract_json_objects("no json here") == []
+
+
+def test_extract_tolerates_raw_newlines_in_strings():
+    assert extract_json_objects('[{"Steps": "open\nclose"}]') == [{"Steps": "open\nclose"}]
+
+
+def test_extract_is_linear_on_truncated_output():
+    # Pathological for the old greedy regex: many objects, unterminated array
+    text = "[" + '{"a": [1, {"b": "}"}]}, ' * 20000 + '{"a": "trunc'
+    start = time.perf_counter()
+    assert len(extract_json_objects(text)) == 20000
+    assert extract_json_objects("[{" * 50000) == []
+    assert time.perf_counter() - start < 2
@@ -0,0 +1,109 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import json, shutil, threading, time, urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from ingest import update_index
+from server import KnowledgeBase, PooledHTTPServer
+
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "sample"
+
+
+def fake_generate(query, evidence, cache=None, limiter=None):
+    # Local stand-in for the LLM: echoes what it was given
+    return {"status": "success", "output_json": [{"Use Case Title": query}],
+            "evidence": [c["source"] for c in evidence], "trace": []}
+
+
+@pytest.fixture
+def serve(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXTRACT_CACHE_DIR", str(tmp_path / "cache"))
+    servers = []
+
+    def start(generate_fn=fake_generate, workers=2, queue=4):
+        docs = tmp_path / "root" / "docs"
+        docs.mkdir(parents=True, exist_ok=True)
+        for path in SAMPLE.glob("*.md"):
+            shutil.copy(path, docs)
+        kb = KnowledgeBase(tmp_path / "index.bin", ingest_root=tmp_path / "root", workers=1)
+        server = PooledHTTPServer(("127.0.0.1", 0), kb, workers=workers, queue=queue, generate_fn=generate_fn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", docs, server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.close()
+
+
+def call(base, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base + path, data=data), timeout=10) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_ingest_retrieve_generate_over_http(serve):
+    base, docs, server = serve()
+    assert call(base, "/retrieve", {"query": "dashboard"}) == (200, {"query": "dashboard", "results": []})
+    status, summary = call(base, "/ingest", {"paths": ["docs"]})
+    assert status == 200 and summary["changed"] == 2 and summary["documents"] == 2
+
+    status, body = call(base, "/retrieve", {"queries": ["dashboard roles", "flight filters"], "top_k": 2})
+    assert status == 200 and [len(r["results"]) for r in body["results"]] == [2, 2]
+    assert body["results"][0]["results"][0]["source"] == "Dashboard Feature.md"
+
+    status, result = call(base, "/generate", {"query": "create dashboard", "top_k": 3})
+    assert status == 200 and result["output_json"] == [{"Use Case Title": "create dashboard"}]
+    assert result["evidence"] and result["trace"][0]["span"] == "retrieve"
+
+    # Ingest adds files; only "prune" drops the ones not listed
+    (docs.parent / "notes.md").write_text("Flight search can be filtered by airline.", encoding="utf-8")
+    assert call(base, "/ingest", {"paths": ["notes.md"]})[1]["documents"] == 3
+    status, summary = call(base, "/ingest", {"paths": ["docs"], "prune": True})
+    assert status == 200 and summary["removed"] == 1 and summary["documents"] == 2
+
+    # An ingest from the CLI is picked up by /reload; the served index is swapped whole
+    (docs / "Dashboard Feature.md").unlink()
+    update_index(sorted(docs.glob("*")), server.kb.chunks_path, prune=True)
+    assert call(base, "/health")[1]["documents"] == 2
+    assert call(base, "/reload", {})[1]["documents"] == 1
+
+
+def test_bad_requests_get_clear_errors(serve):
+    base, _, _ = serve()
+    assert call(base, "/retrieve", {"query": ""})[0] == 400
+    assert call(base, "/retrieve", {"query": "x", "top_k": 0})[0] == 400
+    assert call(base, "/ingest", {"paths": ["../../etc"]})[0] == 403
+    assert call(base, "/nope", {})[0] == 404
+    req = urllib.request.Request(base + "/generate", data=b"not json")
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(req, timeout=10)
+    assert e.value.code == 400
+
+
+def test_requests_beyond_workers_and_queue_get_503(serve):
+    release, started = threading.Event(), threading.Semaphore(0)
+
+    def slow_generate(query, evidence, cache=None, limiter=None):
+        started.release()
+        release.wait(10)
+        return fake_generate(query, evidence)
+
+    base, _, server = serve(slow_generate, workers=1, queue=1)
+    call(base, "/ingest", {"paths": ["docs"]})
+    with ThreadPoolExecutor(2) as pool:
+        running = [pool.submit(call, base, "/generate", {"query": f"dashboard {i}"}) for i in range(2)]
+        assert started.acquire(timeout=10)   # one generating, one queued
+        while server.in_flight < 2:
+            time.sleep(0.01)
+        status, body = call(base, "/health")
+        assert status == 503 and "busy" in body["error"]
+        release.set()
+        assert [f.result()[0] for f in running] == [200, 200]
+    assert call(base, "/health")[1]["in_flight"] == 1   # itself
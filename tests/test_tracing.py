@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import pytest
+from ingest import ingest_files
+from retrieval import BM25Index, retrieve
+from tracing import Tracer, collect, summarize, tracer
+
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "sample"
+
+
+def test_spans_are_collected_and_nest():
+    chunks = ingest_files(sorted(SAMPLE.glob("*.md")), workers=1, cache=False)
+    with collect() as outer:
+        index = BM25Index.build(chunks)
+        with collect() as inner:
+            retrieve("flight filters", chunks, index=index)
+    assert [r["span"] for r in inner] == ["retrieve"]
+    assert [r["span"] for r in outer] == ["index_build", "retrieve"]
+    assert outer[0]["attrs"] == {"kind": "bm25", "chunks": len(chunks)}
+    assert set(summarize(outer)) == {"index_build", "retrieve"}
+
+
+def test_ingest_spans_per_file_type_including_workers():
+    files = sorted(SAMPLE.glob("*.md")) + sorted(SAMPLE.glob("*.txt"))
+    for workers in (1, 2):
+        with collect() as spans:
+            ingest_files(files, workers=workers, cache=False)
+        extract = [r for r in spans if r["span"] == "extract"]
+        assert sorted(r["attrs"]["type"] for r in extract) == sorted(f.suffix[1:] for f in files)
+        assert sum(r["span"] == "chunk" for r in spans) == len(files)
+        assert spans[-1]["span"] == "ingest" and spans[-1]["attrs"]["workers"] == workers
+
+
+def test_corrupt_file_marks_the_extract_span_error(tmp_path, caplog):
+    bad = tmp_path / "broken.pdf"
+    bad.write_bytes(b"%PDF-1.4\nnot really a pdf")
+    with collect() as spans:
+        assert ingest_files([bad], workers=1, cache=False) == []
+    extract = next(r for r in spans if r["span"] == "extract")
+    assert extract["outcome"] == "error" and extract["attrs"]["error"]
+    assert "broken.pdf" in caplog.text
+
+
+def test_errors_mark_the_span_and_prometheus_text():
+    t = Tracer()
+    with pytest.raises(KeyError):
+        with t.span("retrieve"):
+            raise KeyError("x")
+    t.record("retrieve", 3.0)
+    t.record("retrieve", 40.0)
+    text = t.prometheus()
+    assert '# TYPE rag_span_duration_seconds histogram' in text
+    assert 'rag_span_duration_seconds_bucket{span="retrieve",outcome="ok",le="0.005"} 1' in text
+    assert 'rag_span_duration_seconds_bucket{span="retrieve",outcome="ok",le="+Inf"} 2' in text
+    assert 'rag_span_duration_seconds_count{span="retrieve",outcome="error"} 1' in text
+    assert 'rag_span_duration_seconds_sum{span="retrieve",outcome="ok"} 0.043000' in text
+    assert tracer.prometheus().startswith("# HELP")